@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.utils import override_settings
+
+pytest_plugins = [
+    'yatube.pytest_budgets',
+]
+
+_test_settings = None
+_cache_dir = None
+
+
+def pytest_configure(config):
+    """settings of the test run
+
+    The cache and the metrics live in a directory of the run, so nothing
+    cached by a previous run is served against a fresh database. The
+    in-memory test database is shared between threads with table locks
+    and no busy timeout, so thumbnails are generated inline.
+    """
+    global _test_settings, _cache_dir
+    _cache_dir = tempfile.mkdtemp(prefix='yatube-cache-')
+    caches = {
+        alias: dict(
+            options, LOCATION=os.path.join(_cache_dir, 'cache.sqlite3')
+            )
+        for alias, options in settings.CACHES.items()
+        }
+    _test_settings = override_settings(
+        CACHE_DIR=_cache_dir,
+        CACHES=caches,
+        METRICS_DB=os.path.join(_cache_dir, 'metrics.sqlite3'),
+        POSTS_THUMBNAIL_WORKERS=0,
+        )
+    _test_settings.enable()
+
+
+def pytest_unconfigure(config):
+    if _test_settings is not None:
+        _test_settings.disable()
+    if _cache_dir is not None:
+        shutil.rmtree(_cache_dir, ignore_errors=True)
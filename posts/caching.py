@@ -0,0 +1,254 @@
+import hashlib
+import math
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.views.decorators.http import condition
+
+from . import holes
+
+
+def _key(name):
+    return 'generation:{}'.format(name)
+
+
+def _time_key(name):
+    return 'generation-time:{}'.format(name)
+
+
+def _initial():
+    # microseconds: a generation recreated after a cache flush starts
+    # above every value the lost one could have reached, so old keys and
+    # ETags never come back
+    return int(time.time() * 1000000)
+
+
+def get_generations(*names):
+    """current generations of named groups of cache entries, one round trip"""
+    found = cache.get_many([_key(name) for name in names])
+    missing = [name for name in names if _key(name) not in found]
+    for name in missing:
+        cache.add(_key(name), _initial(), None)
+    if missing:
+        found.update(cache.get_many([_key(name) for name in missing]))
+    return [found.get(_key(name), 1) for name in names]
+
+
+def get_generation(name):
+    """current generation of a named group of cache entries"""
+    return get_generations(name)[0]
+
+
+def bump_generation(*names):
+    """invalidates every entry keyed with the current generation of names"""
+    for name in names:
+        try:
+            cache.incr(_key(name))
+        except ValueError:
+            cache.set(_key(name), _initial(), None)
+    cache.set_many({_time_key(name): time.time() for name in names}, None)
+
+
+def last_bumped(*names):
+    """when any of the generations last changed, None if unknown"""
+    found = cache.get_many([_time_key(name) for name in names])
+    if len(found) < len(names):
+        return None
+    return datetime.fromtimestamp(max(found.values()), timezone.utc)
+
+
+def scoped_key(prefix, scope):
+    """cache key that changes with the generation of scope"""
+    return '{}:{}:{}'.format(prefix, scope, get_generation(scope))
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _due(expires, delta, now):
+    """whether to rebuild an entry before it expires
+
+    Probabilistic early refresh: the chance grows toward the expiry, and
+    sooner for entries that are slow to build, so entries cached at the
+    same moment are not all rebuilt at the same moment.
+    """
+    if expires is None:
+        return False
+    beta = _setting('POSTS_CACHE_EARLY_REFRESH_BETA', 1.0)
+    return now - delta * beta * math.log(1 - random.random()) >= expires
+
+
+def _wait(key, lock):
+    """the entry another request is building, None if it gives up"""
+    deadline = time.monotonic() + _setting('POSTS_CACHE_LOCK_WAIT', 2)
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        if cache.get(lock) is None:
+            return None
+    return None
+
+
+def get_or_build(key, build, timeout=None, version=None):
+    """value cached under key, rebuilt by one request at a time
+
+    An entry built for another version, such as older generations, or
+    close to its timeout is stale. One request takes a lock and rebuilds
+    it while the others get the stale copy, or, with no copy at all, wait
+    up to POSTS_CACHE_LOCK_WAIT seconds for the new one. Stale copies are
+    kept POSTS_CACHE_STALE_GRACE seconds past the timeout. A build
+    returning None is not cached.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, built_for, expires, delta = entry
+        if built_for == version and not _due(expires, delta, time.time()):
+            return value
+    lock = 'lock:{}'.format(key)
+    token = uuid.uuid4().hex
+    locked = cache.add(lock, token, _setting('POSTS_CACHE_LOCK_TIMEOUT', 10))
+    if not locked:
+        if entry is None:
+            entry = _wait(key, lock)
+        if entry is not None:
+            return entry[0]
+    try:
+        started = time.monotonic()
+        value = build()
+        if value is not None:
+            delta = time.monotonic() - started
+            expires = hard_timeout = None
+            if timeout is not None:
+                expires = time.time() + timeout
+                grace = _setting('POSTS_CACHE_STALE_GRACE', 60)
+                hard_timeout = timeout + grace
+            cache.set(key, (value, version, expires, delta), hard_timeout)
+    finally:
+        if locked and cache.get(lock) == token:
+            cache.delete(lock)
+    return value
+
+
+def shared_page_by_generation(scopes, key_prefix, timeout=None):
+    """page cache shared by every viewer, keyed by content generations
+
+    scopes is a callable getting the view kwargs and returning the names
+    of the generations the page depends on. The page is rendered once
+    with the user-dependent regions left as holes and kept until one of
+    the generations is bumped; every request, anonymous or logged in,
+    gets a copy with the holes filled for its user. Unlike cache_page the
+    copy does not vary on the session cookie. While one request renders a
+    page after a bump, the others get the previous copy, marked stale so
+    that condition_by_generation sends it without validators.
+    """
+    if timeout is None:
+        timeout = _setting('POSTS_PAGE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            names = ('pages',) + tuple(scopes(**kwargs))
+            key = 'shared_page:{}:{}'.format(
+                key_prefix,
+                hashlib.md5(request.get_full_path().encode()).hexdigest()
+                )
+            version = tuple(get_generations(*names))
+            rendered = []
+
+            def build():
+                request._shared_page = True
+                try:
+                    response = view(request, *args, **kwargs)
+                finally:
+                    request._shared_page = False
+                rendered.append(response)
+                if response.streaming or response.status_code != 200:
+                    return None
+                return (
+                    response.content.decode(response.charset),
+                    response['Content-Type'], version
+                    )
+
+            cached = get_or_build(key, build, timeout, version=version)
+            if rendered:
+                response = rendered[0]
+                if response.streaming:
+                    return response
+                response.content = holes.fill(
+                    request, response.content.decode(response.charset)
+                    )
+                return response
+            content, content_type, built_for = cached
+            response = HttpResponse(
+                holes.fill(request, content), content_type=content_type
+                )
+            response.stale_copy = built_for != version
+            return response
+        return wrapper
+    return decorator
+
+
+def condition_by_generation(scopes, key_prefix):
+    """ETag and Last-Modified from the generations of some scopes
+
+    The generations change whenever anything shown in the scopes does,
+    so an unchanged page is answered with 304 from one cache round trip,
+    before the page cache, the queries and the templates. The ETag also
+    carries the viewer, the CSRF cookie baked into forms and the query
+    string. Browsers are told to revalidate every time. A stale copy of
+    the shared page cache goes out without ETag and Last-Modified: they
+    would name the generations it was not built for.
+    """
+    def names(kwargs):
+        return ('pages', 'post_card') + tuple(scopes(**kwargs))
+
+    def etag(request, *args, **kwargs):
+        user = getattr(request, 'user', None)
+        raw = '|'.join(map(str, (
+            key_prefix,
+            '.'.join(map(str, get_generations(*names(kwargs)))),
+            user.pk if user is not None and user.is_authenticated else '',
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+            request.get_full_path(),
+            )))
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        return last_bumped(*names(kwargs))
+
+    def decorator(view):
+        conditional_view = condition(etag, last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                if getattr(response, 'stale_copy', False):
+                    for header in ('ETag', 'Last-Modified'):
+                        if response.has_header(header):
+                            del response[header]
+                response['Cache-Control'] = 'private, no-cache'
+                if response.has_header('Expires'):
+                    del response['Expires']
+            return response
+        return wrapper
+    return decorator
+
+
+def group_scope(slug):
+    return 'group:{}'.format(slug)
+
+
+def author_scope(username):
+    return 'author:{}'.format(username)
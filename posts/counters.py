@@ -0,0 +1,121 @@
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AuthorStats, Comment, Follow, Post
+
+User = get_user_model()
+
+
+def _count_of(queryset, field):
+    """correlated COUNT(*) of queryset rows whose field matches the outer pk"""
+    counted = queryset.filter(
+        **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+AUTHOR_COUNTERS = {
+    'posts_count': (Post.objects.all(), 'author'),
+    'followers_count': (Follow.objects.all(), 'author'),
+    'following_count': (Follow.objects.all(), 'user'),
+}
+
+
+def count_author(user_id):
+    """actual values of the author counters, straight from the source tables"""
+    return {
+        name: queryset.filter(**{field: user_id}).count()
+        for name, (queryset, field) in AUTHOR_COUNTERS.items()
+        }
+
+
+def author_stats(user):
+    """the counters row of a user, recounted if it does not exist yet"""
+    try:
+        return AuthorStats.objects.get(user_id=user.pk)
+    except AuthorStats.DoesNotExist:
+        stats, _ = AuthorStats.objects.get_or_create(
+            user_id=user.pk, defaults=count_author(user.pk)
+            )
+        return stats
+
+
+def bump_author(user_id, **deltas):
+    """atomically shifts the counters of a user by the given deltas
+
+    A missing row is created from a recount, which already includes the
+    change that triggered the bump. Decrements never create rows: they
+    may come from the cascade that is deleting the user itself. A
+    drifted counter stops at 0 instead of breaking its CHECK constraint.
+    """
+    changes = {
+        name: Greatest(F(name) + delta, 0) for name, delta in deltas.items()
+        }
+    if AuthorStats.objects.filter(user_id=user_id).update(**changes):
+        return
+    if all(delta < 0 for delta in deltas.values()):
+        return
+    try:
+        with transaction.atomic():
+            AuthorStats.objects.create(user_id=user_id, **count_author(user_id))
+    except IntegrityError:
+        AuthorStats.objects.filter(user_id=user_id).update(**changes)
+
+
+def bump_comments(post_id, delta):
+    """atomically shifts the stored comment count of a post, not below 0"""
+    Post.objects.filter(id=post_id).update(
+        comment_count=Greatest(F('comment_count') + delta, 0)
+        )
+
+
+def _id_ranges(queryset, batch_size):
+    ids = queryset.order_by('pk').values_list('pk', flat=True)
+    first, last = ids.first(), ids.last()
+    if first is None:
+        return
+    for start in range(first, last + 1, batch_size):
+        yield start, start + batch_size - 1
+
+
+def recount_posts(batch_size=1000):
+    """repairs Post.comment_count, returns the number of fixed posts"""
+    fixed = 0
+    actual = _count_of(Comment.objects.all(), 'post')
+    for start, end in _id_ranges(Post.objects.all(), batch_size):
+        with transaction.atomic():
+            batch = Post.objects.filter(pk__range=(start, end))
+            fixed += batch.annotate(actual=actual).exclude(
+                comment_count=F('actual')
+                ).count()
+            batch.update(comment_count=actual)
+    return fixed
+
+
+def recount_authors(batch_size=1000):
+    """repairs AuthorStats rows, returns the number of fixed rows"""
+    fixed = 0
+    actual = {
+        name: _count_of(queryset, field)
+        for name, (queryset, field) in AUTHOR_COUNTERS.items()
+        }
+    drift = Q()
+    for name in actual:
+        drift |= ~Q(**{name: F(f'actual_{name}')})
+    for start, end in _id_ranges(User.objects.all(), batch_size):
+        with transaction.atomic():
+            users = User.objects.filter(pk__range=(start, end))
+            AuthorStats.objects.bulk_create(
+                [AuthorStats(user_id=pk)
+                 for pk in users.values_list('pk', flat=True)],
+                ignore_conflicts=True
+                )
+            batch = AuthorStats.objects.filter(user__id__range=(start, end))
+            fixed += batch.annotate(**{
+                f'actual_{name}': expression
+                for name, expression in actual.items()
+                }).filter(drift).count()
+            batch.update(**actual)
+    return fixed
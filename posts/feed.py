@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.db.models import Q, Sum
+
+from .models import AuthorStats, Follow, Post, TimelineEntry
+
+
+def _batch_size():
+    return getattr(settings, 'POSTS_TIMELINE_BATCH_SIZE', 500)
+
+
+def fanout_threshold():
+    """follower count from which an author's posts are pulled, not pushed"""
+    return getattr(settings, 'POSTS_FANOUT_FOLLOWER_LIMIT', 1000)
+
+
+def should_fan_out(author_id):
+    """push for ordinary authors, pull for high-follower ones
+
+    A threshold of 0 or less pulls the posts of every author.
+    """
+    threshold = fanout_threshold()
+    if threshold <= 0:
+        return False
+    followers = Follow.objects.filter(author_id=author_id)
+    return not followers[threshold - 1:threshold].exists()
+
+
+def fan_out_post(post):
+    """delivers a new post to the timelines of the author's followers
+
+    Posts of authors over the follower threshold are only marked as not
+    fanned out; readers pull them in at read time.
+    """
+    if not should_fan_out(post.author_id):
+        Post.objects.filter(id=post.id).update(fanned_out=False)
+        post.fanned_out = False
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+        ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers.iterator()),
+        batch_size=_batch_size(),
+        ignore_conflicts=True
+        )
+
+
+def backfill_timeline(user_id, author_id):
+    """copies the pushed posts of a newly followed author"""
+    posts = Post.objects.filter(
+        author_id=author_id, fanned_out=True
+        ).values_list('id', 'pub_date')
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts.iterator()),
+        batch_size=_batch_size(),
+        ignore_conflicts=True
+        )
+
+
+def prune_timeline(user_id, author_id):
+    """removes the posts of an unfollowed author"""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+        ).delete()
+
+
+def timeline_posts(user):
+    """posts of the follow feed, newest first
+
+    Pushed posts come from the user's own timeline rows, ordered by their
+    copy of pub_date, so a page is a range of the (user, -pub_date) index
+    of the timeline. When the user follows authors with pulled posts,
+    those are merged in by one query over the posts instead.
+    """
+    followed = Follow.objects.filter(user=user).values('author_id')
+    pulled = Q(fanned_out=False, author_id__in=followed)
+    if not Post.objects.filter(pulled).exists():
+        return Post.objects.filter(timeline__user=user).order_by(
+            '-timeline__pub_date', '-timeline__post'
+            )
+    pushed = TimelineEntry.objects.filter(user=user).values('post_id')
+    return Post.objects.filter(Q(id__in=pushed) | pulled).order_by(
+        '-pub_date', '-id'
+        )
+
+
+def feed_size(user):
+    """number of posts in the follow feed, from the stored author counters"""
+    return AuthorStats.objects.filter(
+        user__following__user=user
+        ).aggregate(total=Sum('posts_count'))['total'] or 0
@@ -1,4 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+
+from .images import ingest
 from .models import Post, Comment
 
 
@@ -23,6 +26,12 @@ class PostForm(forms.ModelForm):
             raise forms.ValidationError('Поле обязательно для заполнения')
         return data
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            image = ingest(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
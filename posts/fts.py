@@ -0,0 +1,115 @@
+"""SQLite FTS5 mirror of posts_post.text
+
+Two external-content FTS5 tables index the post texts: one with the
+unicode61 word tokenizer and one with the trigram tokenizer for partial
+words. Triggers keep them in sync with posts_post. SQLite rebuilds a
+table (and loses its triggers) on many ALTERs, so install() is
+idempotent and runs after every migrate as well.
+"""
+from django.db import OperationalError
+
+WORD_TABLE = 'posts_post_fts'
+TRIGRAM_TABLE = 'posts_post_trigram'
+TOKENIZERS = {
+    WORD_TABLE: 'unicode61 remove_diacritics 2',
+    TRIGRAM_TABLE: 'trigram',
+}
+
+TRIGGERS = (
+    ('{table}_ai', 'AFTER INSERT ON posts_post BEGIN '
+     'INSERT INTO {table}(rowid, text) VALUES (new.id, new.text); END'),
+    ('{table}_ad', 'AFTER DELETE ON posts_post BEGIN '
+     "INSERT INTO {table}({table}, rowid, text) "
+     "VALUES ('delete', old.id, old.text); END"),
+    ('{table}_au', 'AFTER UPDATE OF text ON posts_post BEGIN '
+     "INSERT INTO {table}({table}, rowid, text) "
+     "VALUES ('delete', old.id, old.text); "
+     'INSERT INTO {table}(rowid, text) VALUES (new.id, new.text); END'),
+)
+
+
+def _existing(cursor, kind):
+    cursor.execute('SELECT name FROM sqlite_master WHERE type = %s', [kind])
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _install_table(cursor, table):
+    """creates one FTS table with its triggers, False if unsupported"""
+    tables = _existing(cursor, 'table')
+    if table not in tables:
+        try:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE {} USING fts5(text, content='posts_post', "
+                "content_rowid='id', tokenize='{}')".format(
+                    table, TOKENIZERS[table]
+                    )
+                )
+        except OperationalError:
+            return False
+    triggers = _existing(cursor, 'trigger')
+    missing = [
+        (name.format(table=table), body.format(table=table))
+        for name, body in TRIGGERS
+        if name.format(table=table) not in triggers
+        ]
+    for name, body in missing:
+        cursor.execute('CREATE TRIGGER {} {}'.format(name, body))
+    if missing:
+        cursor.execute(
+            "INSERT INTO {0}({0}) VALUES ('rebuild')".format(table)
+            )
+    return True
+
+
+def install(connection):
+    """creates the FTS tables and triggers that the database supports"""
+    if connection.vendor != 'sqlite':
+        return set()
+    installed = set()
+    with connection.cursor() as cursor:
+        for table in TOKENIZERS:
+            if _install_table(cursor, table):
+                installed.add(table)
+    connection.fts_tables = None
+    return installed
+
+
+def uninstall(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for table in TOKENIZERS:
+            for name, _ in TRIGGERS:
+                cursor.execute(
+                    'DROP TRIGGER IF EXISTS {}'.format(name.format(table=table))
+                    )
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(table))
+    connection.fts_tables = None
+
+
+def available_tables(connection):
+    """FTS tables present in the database
+
+    Looked up once per database connection, as every search asks;
+    install() and uninstall() forget the answer of their connection.
+    """
+    if connection.vendor != 'sqlite':
+        return set()
+    known = getattr(connection, 'fts_tables', None)
+    if known is not None and known[0] is connection.connection:
+        return known[1]
+    with connection.cursor() as cursor:
+        tables = _existing(cursor, 'table') & set(TOKENIZERS)
+    connection.fts_tables = (connection.connection, tables)
+    return tables
+
+
+def match(connection, table, expression, limit):
+    """rowids matching an FTS5 expression, best bm25 rank first"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT rowid FROM {0} WHERE {0} MATCH %s '
+            'ORDER BY bm25({0}), rowid DESC LIMIT %s'.format(table),
+            [expression, limit]
+            )
+        return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,92 @@
+"""user-dependent regions punched out of shared cached pages
+
+A page rendered for the shared cache carries a marker instead of each
+region that depends on the viewer: the nav, the feed tabs, the owner
+buttons, the follow button and the comment form with its CSRF token.
+fill() renders the regions for the current request into a copy taken
+from the cache. User content cannot forge a marker, since the templates
+escape "<".
+"""
+import base64
+import json
+import re
+
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .forms import CommentForm
+from .models import Follow
+
+MARKER = '<!--hole:{}-->'
+MARKER_REGEX = re.compile(r'<!--hole:([A-Za-z0-9_\-=]+)-->')
+
+
+def follow_context(request, user, params):
+    follow = user.is_authenticated and Follow.objects.filter(
+        author_id=params['author_id'], user=user
+        ).exists()
+    return {'follow': follow}
+
+
+def comment_form_context(request, user, params):
+    return {'form': CommentForm()}
+
+
+def is_owner(user, params):
+    return user.is_authenticated and user.pk == params['author_id']
+
+
+def is_reader(user, params):
+    return user.is_authenticated and user.pk != params['author_id']
+
+
+def is_logged_in(user, params):
+    return user.is_authenticated
+
+
+# name: (template, function adding to the context, function telling
+# whether the region shows anything for the user, None for always);
+# a page has a hole per comment, so empty ones skip the template
+HOLES = {
+    'user_nav': ('user_nav.html', None, None),
+    'menu': ('menu.html', None, None),
+    'post_buttons': ('post_buttons.html', None, is_owner),
+    'follow_button': ('follow_button.html', follow_context, is_reader),
+    'comment_form': (
+        'comment_form.html', comment_form_context, is_logged_in
+        ),
+    'comment_buttons': ('comment_buttons.html', None, is_owner),
+}
+
+
+def is_shared(request):
+    """whether the request renders a page for the shared cache"""
+    return getattr(request, '_shared_page', False)
+
+
+def marker(name, params):
+    raw = json.dumps([name, params], separators=(',', ':'))
+    return mark_safe(
+        MARKER.format(base64.urlsafe_b64encode(raw.encode()).decode())
+        )
+
+
+def render(name, params, request=None, user=None):
+    """a region rendered for the viewer"""
+    template, extra, visible = HOLES[name]
+    if user is None:
+        user = request.user
+    if visible is not None and not visible(user, params):
+        return ''
+    context = dict(params, user=user)
+    if extra is not None:
+        context.update(extra(request, user, params))
+    return render_to_string(template, context, request=request)
+
+
+def fill(request, html):
+    """a shared page with every marker replaced by its region"""
+    def region(match):
+        name, params = json.loads(base64.urlsafe_b64decode(match.group(1)))
+        return render(name, params, request)
+    return MARKER_REGEX.sub(region, html)
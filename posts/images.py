@@ -0,0 +1,222 @@
+"""memory-bounded ingest of uploaded post images
+
+Uploads above FILE_UPLOAD_MAX_MEMORY_SIZE are streamed to a temporary
+file by Django, so the upload itself never sits in memory. PostForm
+checks the image from its header before any pixel is decoded, JPEGs are
+decoded straight at a reduced scale, and the decoded frame has to fit
+POSTS_IMAGE_DECODE_BUDGET, which for other formats lowers the pixel
+limit. Oversized originals are downscaled and metadata is stripped by
+re-encoding, the result is spooled to disk past the same budget.
+"""
+import os
+import re
+from datetime import timedelta
+from tempfile import SpooledTemporaryFile
+
+from django import forms
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps
+from sorl.thumbnail import delete
+
+from .models import StoredImage
+from .storage import SHARDED_IMAGE_REGEX
+
+# the ICC profile is kept: it is colour data rather than metadata
+METADATA_KEYS = (
+    'exif', 'xmp', 'XML:com.adobe.xmp', 'photoshop', 'comment', 'iptc',
+)
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 85},
+    'GIF': {},
+}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def max_upload_size():
+    return _setting('POSTS_IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 * 1024)
+
+
+def max_side():
+    return _setting('POSTS_IMAGE_MAX_SIDE', 2560)
+
+
+def max_pixels():
+    return _setting('POSTS_IMAGE_MAX_PIXELS', 50_000_000)
+
+
+def decode_budget():
+    return _setting('POSTS_IMAGE_DECODE_BUDGET', 64 * 1024 * 1024)
+
+
+def collect_grace():
+    return _setting('POSTS_IMAGE_COLLECT_GRACE', 600)
+
+
+def allowed_formats():
+    return _setting('POSTS_IMAGE_ALLOWED_FORMATS', tuple(SAVE_OPTIONS))
+
+
+def _has_metadata(image):
+    return any(key in image.info for key in METADATA_KEYS) or bool(
+        image.getexif()
+        )
+
+
+def check_size(upload):
+    if upload.size is not None and upload.size > max_upload_size():
+        raise forms.ValidationError(
+            'Файл слишком большой: не больше %(limit)s МБ',
+            code='file_too_large',
+            params={'limit': max_upload_size() // (1024 * 1024)}
+            )
+
+
+def ingest(upload):
+    """the upload checked, downscaled and stripped, or the upload itself
+
+    Raises forms.ValidationError for uploads that are too large, in an
+    unsupported format or with too many pixels.
+    """
+    check_size(upload)
+    upload.seek(0)
+    with Image.open(upload) as image:
+        if image.format not in allowed_formats():
+            raise forms.ValidationError(
+                'Формат %(format)s не поддерживается',
+                code='invalid_format', params={'format': image.format}
+                )
+        width, height = image.size
+        too_many_pixels = forms.ValidationError(
+            'Картинка слишком большая: %(width)s×%(height)s',
+            code='too_many_pixels',
+            params={'width': width, 'height': height}
+            )
+        if width * height > max_pixels():
+            raise too_many_pixels
+        oversized = max(width, height) > max_side()
+        animated = getattr(image, 'is_animated', False)
+        if animated:
+            if oversized:
+                raise forms.ValidationError(
+                    'Анимация больше %(side)s пикселей по стороне',
+                    code='animation_too_large', params={'side': max_side()}
+                    )
+            upload.seek(0)
+            return upload
+        if not oversized and not _has_metadata(image):
+            upload.seek(0)
+            return upload
+        if _decoded_size(image) > decode_budget():
+            # the pixel limit and the budget reject alike, whichever is
+            # lower for the format
+            raise too_many_pixels
+        return _reencode(image, upload.name)
+
+
+def _target_size(image):
+    """size of the image fitted into POSTS_IMAGE_MAX_SIDE"""
+    width, height = image.size
+    scale = min(1, max_side() / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _decoded_size(image):
+    """bytes of the frame _reencode decodes
+
+    JPEGs are set to decode at a reduced DCT scale: the decoder skips
+    detail instead of allocating the full frame and throwing most of it
+    away afterwards. The scale still covers the target size, unless the
+    full frame is over the budget: then it covers half of it, so the
+    frame is smaller than the target and the result may come out up to
+    half as large. Other formats are decoded at full size.
+    """
+    bands = len(image.getbands())
+    if image.format == 'JPEG':
+        width, height = _target_size(image)
+        if image.size[0] * image.size[1] * bands > decode_budget():
+            width, height = -(-width // 2), -(-height // 2)
+        image.draft(image.mode, (width, height))
+    return image.size[0] * image.size[1] * bands
+
+
+def _reencode(image, name):
+    format_ = image.format
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side(), max_side()), Image.LANCZOS)
+    image.info = {
+        key: value for key, value in image.info.items()
+        if key not in METADATA_KEYS
+        }
+    if format_ == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+    output = SpooledTemporaryFile(max_size=decode_budget())
+    image.save(output, format=format_, **SAVE_OPTIONS.get(format_, {}))
+    size = output.tell()
+    output.seek(0)
+    return UploadedFile(
+        output, name=os.path.basename(name),
+        content_type=Image.MIME.get(format_), size=size
+        )
+
+
+def is_shared(name):
+    """whether an image is stored by content and may be shared by posts"""
+    return bool(name) and re.match(SHARDED_IMAGE_REGEX, name) is not None
+
+
+def acquire(name, count=1):
+    """counts count more posts using a stored image"""
+    if not is_shared(name):
+        return
+    if StoredImage.objects.filter(name=name).update(refs=F('refs') + count):
+        return
+    try:
+        with transaction.atomic():
+            StoredImage.objects.create(name=name, refs=count)
+    except IntegrityError:
+        StoredImage.objects.filter(name=name).update(refs=F('refs') + count)
+
+
+def release(name, delete_file=True):
+    """counts one post less, deleting the file after the last one
+
+    Images outside the content-addressed layout are never deleted here.
+    """
+    if not is_shared(name):
+        return
+    StoredImage.objects.filter(name=name, refs__gt=0).update(
+        refs=F('refs') - 1
+        )
+    if delete_file:
+        transaction.on_commit(lambda: collect(name))
+
+
+def collect(name):
+    """deletes an image and its thumbnails if no post uses it any more
+
+    The file stays if a post counted it again meanwhile, or if it was
+    saved in the last POSTS_IMAGE_COLLECT_GRACE seconds: the storage
+    hands out stored files by name, and the post it was saved for may
+    not count it yet. collect_media deletes it later if no post does.
+    """
+    deleted, _ = StoredImage.objects.filter(name=name, refs=0).delete()
+    if not deleted or StoredImage.objects.filter(name=name).exists():
+        return
+    try:
+        saved = default_storage.get_modified_time(name)
+    except FileNotFoundError:
+        saved = None
+    if saved is not None and (
+            timezone.now() - saved < timedelta(seconds=collect_grace())):
+        return
+    delete(name)
@@ -0,0 +1,351 @@
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib import request as urllib_request
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.middleware.csrf import _get_new_csrf_token
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from posts import urls
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+QUERIES_REGEX = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(values, share):
+    """linear interpolation between the closest ranks of sorted values"""
+    if not values:
+        return None
+    position = (len(values) - 1) * share
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+class Target:
+
+    """the sample rows the URLs of posts.urls are pointed at"""
+
+    def __init__(self, username):
+        if username:
+            self.user = User.objects.get(username=username)
+        else:
+            # the reader with the biggest follow feed
+            self.user = User.objects.annotate(
+                n=Count('follower')
+                ).order_by('-n', 'id').first()
+        if self.user is None:
+            raise CommandError('no users, run the seed command first')
+        self.author = User.objects.annotate(
+            n=Count('posts')
+            ).exclude(id=self.user.id).order_by('-n', 'id').first()
+        self.post = Post.objects.filter(
+            author=self.author
+            ).order_by('-comment_count', 'id').first()
+        self.own_post = Post.objects.filter(author=self.user).first()
+        self.group = Group.objects.annotate(
+            n=Count('posts')
+            ).order_by('-n', 'id').first()
+        if self.author is None or self.post is None or self.group is None:
+            raise CommandError('no posts, run the seed command first')
+        word = Post.objects.values_list('text', flat=True).first().split()
+        self.query = word[0] if word else 'пост'
+
+    def throwaway_post(self):
+        return Post.objects.create(text='Удаляемый пост', author=self.user)
+
+    def throwaway_comment(self):
+        return Comment.objects.create(
+            post=self.post, author=self.user, text='Удаляемый комментарий'
+            )
+
+    def scenarios(self):
+        """URL name: callable returning (method, path, form data)"""
+        author, post = self.author.username, self.post.id
+        own = self.own_post or self.throwaway_post()
+
+        def get(name, **kwargs):
+            return lambda: ('GET', reverse(name, kwargs=kwargs), None)
+
+        def post_delete():
+            doomed = self.throwaway_post()
+            return 'GET', reverse('post_delete', kwargs={
+                'username': self.user.username, 'post_id': doomed.id
+                }), None
+
+        def comment_delete():
+            doomed = self.throwaway_comment()
+            return 'GET', reverse('comment_delete', kwargs={
+                'username': author, 'post_id': post,
+                'author_comment': self.user.username,
+                'comment_id': doomed.id
+                }), None
+
+        def profile_unfollow():
+            # the follow is restored untimed, so every request deletes one
+            Follow.objects.get_or_create(user=self.user, author=self.author)
+            return get('profile_unfollow', username=author)()
+
+        return {
+            'index': get('index'),
+            'new_post': get('new_post'),
+            'group_posts': get('group_posts', slug=self.group.slug),
+            'follow_index': get('follow_index'),
+            'search_post': lambda: ('GET', '{}?{}'.format(
+                reverse('search_post'), urlencode({'search_query': self.query})
+                ), None),
+            'profile_follow': get('profile_follow', username=author),
+            'profile_unfollow': profile_unfollow,
+            'profile': get('profile', username=author),
+            'post': get('post', username=author, post_id=post),
+            'post_edit': get(
+                'post_edit', username=self.user.username, post_id=own.id
+                ),
+            'add_comment': lambda: ('POST', reverse('add_comment', kwargs={
+                'username': author, 'post_id': post
+                }), {'text': 'Комментарий из бенчмарка'}),
+            'post_delete': post_delete,
+            'comment_delete': comment_delete,
+            }
+
+
+class ClientDriver:
+
+    """requests through the Django test client, in this process"""
+
+    def __init__(self, user):
+        self.user = user
+        self.local = threading.local()
+
+    def __call__(self, method, path, data):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client()
+            client.force_login(self.user)
+        try:
+            if method == 'POST':
+                response = client.post(path, data)
+            else:
+                response = client.get(path)
+        except Exception:
+            # the test client re-raises what a server would answer with 500
+            return 500, ''
+        return response.status_code, response.get('Server-Timing', '')
+
+
+class NoRedirect(urllib_request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class ServerDriver:
+
+    """requests to a running server sharing the database and sessions"""
+
+    def __init__(self, user, base_url):
+        client = Client()
+        client.force_login(user)
+        self.session = client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.csrf = _get_new_csrf_token()
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib_request.build_opener(NoRedirect())
+
+    def __call__(self, method, path, data):
+        body = urlencode(data).encode() if data is not None else None
+        request = urllib_request.Request(
+            self.base_url + path, data=body, method=method
+            )
+        request.add_header('Cookie', '{}={}; {}={}'.format(
+            settings.SESSION_COOKIE_NAME, self.session,
+            settings.CSRF_COOKIE_NAME, self.csrf
+            ))
+        request.add_header('X-CSRFToken', self.csrf)
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status, response.headers.get(
+                    'Server-Timing', ''
+                    )
+        except HTTPError as error:
+            return error.code, error.headers.get('Server-Timing', '')
+
+
+class Command(BaseCommand):
+    help = ('Drives every URL of posts.urls and reports latency '
+            'percentiles, throughput and queries per request as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=100,
+            help='timed requests per URL'
+            )
+        parser.add_argument(
+            '--concurrency', type=int, default=4,
+            help='requests in flight at once'
+            )
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help='untimed requests per URL before the timed ones'
+            )
+        parser.add_argument(
+            '--server',
+            help='base URL of a local server to drive instead of the '
+                 'test client, e.g. http://127.0.0.1:8000'
+            )
+        parser.add_argument(
+            '--user', help='username of the logged-in requests'
+            )
+        parser.add_argument(
+            '--only', nargs='*', default=None,
+            help='URL names to run, all of posts.urls by default'
+            )
+        parser.add_argument('--output', help='file for the JSON report')
+        parser.add_argument(
+            '--compare',
+            help='JSON report of an earlier run to check for regressions'
+            )
+        parser.add_argument(
+            '--threshold', type=float, default=20,
+            help='percent of p95 growth that counts as a regression'
+            )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1')
+        target = Target(options['user'])
+        scenarios = target.scenarios()
+        names = [pattern.name for pattern in urls.urlpatterns]
+        missing = set(names) - set(scenarios)
+        if missing:
+            raise CommandError(
+                'no scenario for ' + ', '.join(sorted(missing))
+                )
+        if options['only']:
+            names = [name for name in names if name in options['only']]
+        results = {}
+        if options['server']:
+            if settings.DEBUG:
+                self.stderr.write(
+                    'DEBUG is on: a server with these settings renders the '
+                    'debug toolbar into every page'
+                    )
+            driver = ServerDriver(target.user, options['server'])
+            for name in names:
+                results[name] = self.run(driver, scenarios[name], options)
+                self.report(name, results[name])
+        else:
+            # measured as in production, without the debug toolbar
+            driver = ClientDriver(target.user)
+            with override_settings(DEBUG=False):
+                for name in names:
+                    results[name] = self.run(driver, scenarios[name], options)
+                    self.report(name, results[name])
+        report = {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'mode': 'server' if options['server'] else 'client',
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'dataset': {
+                'users': User.objects.count(),
+                'posts': Post.objects.count(),
+                'comments': Comment.objects.count(),
+                'follows': Follow.objects.count(),
+                },
+            'results': results,
+            }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, ensure_ascii=False)
+        if options['compare']:
+            self.compare(results, options['compare'], options['threshold'])
+
+    def run(self, driver, scenario, options):
+        def one(_):
+            try:
+                method, path, data = scenario()
+            except Exception:
+                # the untimed setup lost a write lock, counted as an error
+                return None, 0, None
+            started = time.perf_counter()
+            status, timing = driver(method, path, data)
+            elapsed = time.perf_counter() - started
+            match = QUERIES_REGEX.search(timing)
+            return elapsed, status, int(match.group(1)) if match else None
+
+        for n in range(options['warmup']):
+            one(n)
+        started = time.perf_counter()
+        if options['concurrency'] <= 1:
+            samples = [one(n) for n in range(options['requests'])]
+        else:
+            with ThreadPoolExecutor(options['concurrency']) as pool:
+                samples = list(pool.map(one, range(options['requests'])))
+        wall = time.perf_counter() - started
+
+        latencies = sorted(
+            elapsed * 1000 for elapsed, _, _ in samples if elapsed is not None
+            )
+        queries = [n for _, _, n in samples if n is not None]
+        return {
+            'requests': len(samples),
+            'errors': sum(
+                status >= 500 or status == 0 for _, status, _ in samples
+                ),
+            'statuses': sorted({status for _, status, _ in samples}),
+            'p50_ms': percentile(latencies, 0.5),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'mean_ms': sum(latencies) / len(latencies) if latencies else None,
+            'throughput_rps': len(samples) / wall if wall else None,
+            'queries_per_request': (
+                sum(queries) / len(queries) if queries else None
+                ),
+            }
+
+    def report(self, name, result):
+        if result['p50_ms'] is None:
+            self.stdout.write(f'{name:<16} {result["errors"]} errors')
+            return
+        queries = result['queries_per_request']
+        self.stdout.write(
+            f'{name:<16} p50 {result["p50_ms"]:8.1f} ms  '
+            f'p95 {result["p95_ms"]:8.1f} ms  '
+            f'p99 {result["p99_ms"]:8.1f} ms  '
+            f'{result["throughput_rps"]:8.1f} req/s  '
+            f'{queries if queries is None else round(queries, 1)} queries  '
+            f'{result["errors"]} errors'
+            )
+
+    def compare(self, results, path, threshold):
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if not before or not before['p95_ms']:
+                continue
+            change = (result['p95_ms'] / before['p95_ms'] - 1) * 100
+            queries = result['queries_per_request'] or 0
+            # half a query of slack for runs where a few requests failed
+            more_queries = queries > (before['queries_per_request'] or 0) + 0.5
+            self.stdout.write(
+                f'{name:<16} p95 {change:+.1f}%, queries '
+                f'{before["queries_per_request"]} -> '
+                f'{result["queries_per_request"]}'
+                )
+            if change > threshold or more_queries:
+                regressions.append(name)
+        if regressions:
+            raise CommandError('regressions: ' + ', '.join(regressions))
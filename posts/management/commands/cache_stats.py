@@ -0,0 +1,36 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+from yatube.cache import TieredCache
+
+
+class Command(BaseCommand):
+    help = ('Reports hits, misses and L1 evictions of the shared cache per '
+            'key prefix, summed over the worker processes')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='clear the counters after the report'
+            )
+
+    def handle(self, *args, **options):
+        cache = caches['default']
+        if not isinstance(cache, TieredCache):
+            raise CommandError('the default cache is not a TieredCache')
+        _, l2_entries = cache.size()
+        self.stdout.write(f'L2 entries: {l2_entries}')
+        self.stdout.write(
+            f'{"prefix":<24}{"L1 hits":>10}{"L2 hits":>10}'
+            f'{"misses":>10}{"evictions":>10}{"hit rate":>10}'
+            )
+        for prefix, counts in cache.stats(everywhere=True).items():
+            hits = counts['l1_hits'] + counts['l2_hits']
+            lookups = hits + counts['misses']
+            rate = hits / lookups if lookups else 0
+            self.stdout.write(
+                f'{prefix:<24}{counts["l1_hits"]:>10}{counts["l2_hits"]:>10}'
+                f'{counts["misses"]:>10}{counts["evictions"]:>10}{rate:>10.1%}'
+                )
+        if options['reset']:
+            cache.reset_stats()
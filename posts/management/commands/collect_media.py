@@ -0,0 +1,162 @@
+import os
+import posixpath
+import time
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from sorl.thumbnail import default as sorl
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore
+
+from posts.models import Post, StoredImage
+from posts.storage import IMAGE_DIRECTORY
+
+
+def walk(storage, directory):
+    """file names under a directory
+
+    Local directories are read entry by entry, so a directory of millions
+    of files is never listed in memory at once; storages without local
+    paths are read one directory listing at a time.
+    """
+    try:
+        path = storage.path(directory)
+    except NotImplementedError:
+        directories, files = storage.listdir(directory)
+        for name in files:
+            yield posixpath.join(directory, name)
+    else:
+        directories = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    directories.append(entry.name)
+                else:
+                    yield posixpath.join(directory, entry.name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+def batches(names, size):
+    batch = []
+    for name in names:
+        batch.append(name)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stored_keys(identity, size):
+    """sorl thumbnail store keys, read page by page"""
+    prefix = add_prefix('', identity)
+    last = prefix
+    while True:
+        keys = list(KVStore.objects.filter(
+            key__startswith=prefix, key__gt=last
+            ).order_by('key').values_list('key', flat=True)[:size])
+        if not keys:
+            return
+        last = keys[-1]
+        for key in keys:
+            yield del_prefix(key)
+
+
+class Command(BaseCommand):
+    help = ('Deletes post images no post refers to, thumbnails of deleted '
+            'images and stale thumbnail store entries')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='only report what would be deleted'
+            )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='file names checked against the database per query'
+            )
+        parser.add_argument(
+            '--rate', type=float, default=0,
+            help='deleted files per second at most, 0 for no limit'
+            )
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='seconds a file must be old to be deleted, so uploads '
+                 'whose post is not saved yet are kept'
+            )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.rate = options['rate']
+        self.cutoff = timezone.now() - timedelta(seconds=options['min_age'])
+        self.files = self.bytes = 0
+        storage = default_storage
+
+        for batch in batches(
+                walk(storage, IMAGE_DIRECTORY), options['batch_size']):
+            used = set(Post.objects.filter(image__in=batch).values_list(
+                'image', flat=True
+                ))
+            for name in batch:
+                if name not in used and self.is_old(storage, name):
+                    self.remove(storage, name)
+                    if not self.dry_run:
+                        StoredImage.objects.filter(name=name).delete()
+        images = self.files, self.bytes
+
+        kvstore = sorl.kvstore
+        stale = 0
+        for key in stored_keys('thumbnails', options['batch_size']):
+            source = kvstore._get(key)
+            if source is not None and source.exists():
+                continue
+            stale += 1
+            for thumbnail_key in kvstore._get(key, identity='thumbnails') or []:
+                thumbnail = kvstore._get(thumbnail_key)
+                if thumbnail is not None and thumbnail.exists():
+                    self.remove(thumbnail.storage, thumbnail.name)
+                if not self.dry_run:
+                    kvstore._delete(thumbnail_key)
+            if not self.dry_run:
+                kvstore._delete(key, identity='thumbnails')
+                kvstore._delete(key)
+        for key in stored_keys('image', options['batch_size']):
+            image = kvstore._get(key)
+            if image is not None and not image.exists():
+                stale += 1
+                if not self.dry_run:
+                    kvstore._delete(key)
+
+        prefix = sorl_settings.THUMBNAIL_PREFIX.rstrip('/')
+        thumbnails = sorl.storage
+        if thumbnails.exists(prefix):
+            for name in walk(thumbnails, prefix):
+                if (kvstore.get(ImageFile(name, thumbnails)) is None
+                        and self.is_old(thumbnails, name)):
+                    self.remove(thumbnails, name)
+
+        verb = 'would reclaim' if self.dry_run else 'reclaimed'
+        self.stdout.write(
+            f'orphaned images: {images[0]}, {images[1]} bytes'
+            )
+        self.stdout.write(f'stale thumbnail store entries: {stale}')
+        self.stdout.write(
+            f'{verb}: {self.files} files, {self.bytes} bytes'
+            )
+
+    def is_old(self, storage, name):
+        return storage.get_modified_time(name) < self.cutoff
+
+    def remove(self, storage, name):
+        self.files += 1
+        self.bytes += storage.size(name)
+        if self.dry_run:
+            return
+        storage.delete(name)
+        if self.rate:
+            time.sleep(1 / self.rate)
@@ -0,0 +1,83 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from posts.feed import fanout_threshold
+from posts.models import Follow, Post
+
+
+class Command(BaseCommand):
+    help = ('Reports write amplification and read cost of the follow '
+            'feed for the current Follow graph')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold', type=int, default=None,
+            help='follower limit to simulate instead of the configured one'
+            )
+
+    def handle(self, *args, **options):
+        threshold = options['threshold']
+        if threshold is None:
+            threshold = fanout_threshold()
+        followers = dict(
+            Follow.objects.values_list('author_id').annotate(n=Count('id'))
+            )
+        posts = dict(
+            Post.objects.values_list('author_id').annotate(n=Count('id'))
+            )
+        total_posts = sum(posts.values()) or 1
+        pulled = {a for a, n in followers.items() if n >= threshold}
+
+        push_writes = sum(
+            posts.get(author, 0) * n
+            for author, n in followers.items() if author not in pulled
+            )
+        all_writes = sum(
+            posts.get(author, 0) * n for author, n in followers.items()
+            )
+        biggest_push = max(
+            (n for a, n in followers.items() if a not in pulled), default=0
+            )
+
+        pulled_authors = defaultdict(int)
+        pulled_posts = defaultdict(int)
+        joined_posts = defaultdict(int)
+        follows = Follow.objects.values_list('user_id', 'author_id')
+        for user_id, author_id in follows.iterator():
+            joined_posts[user_id] += posts.get(author_id, 0)
+            if author_id in pulled:
+                pulled_authors[user_id] += 1
+                pulled_posts[user_id] += posts.get(author_id, 0)
+        readers = len(joined_posts) or 1
+
+        self.stdout.write(f'follower threshold: {threshold}')
+        self.stdout.write(
+            f'authors: {len(followers)} followed, {len(pulled)} pulled'
+            )
+        self.stdout.write(f'follow edges: {sum(followers.values())}')
+        self.stdout.write(f'posts: {sum(posts.values())}')
+        self.stdout.write('write amplification (timeline rows per post):')
+        self.stdout.write(f'  hybrid: {push_writes / total_posts:.2f}')
+        self.stdout.write(f'  pure push: {all_writes / total_posts:.2f}')
+        self.stdout.write(f'  largest single fan-out: {biggest_push}')
+        self.stdout.write('read cost per reader of the follow feed:')
+        self.stdout.write(
+            '  pulled authors merged: avg {:.2f}, max {}'.format(
+                sum(pulled_authors.values()) / readers,
+                max(pulled_authors.values(), default=0)
+                )
+            )
+        self.stdout.write(
+            '  pulled candidate posts: avg {:.2f}, max {}'.format(
+                sum(pulled_posts.values()) / readers,
+                max(pulled_posts.values(), default=0)
+                )
+            )
+        self.stdout.write(
+            '  pure pull joined posts: avg {:.2f}, max {}'.format(
+                sum(joined_posts.values()) / readers,
+                max(joined_posts.values(), default=0)
+                )
+            )
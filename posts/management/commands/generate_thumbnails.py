@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+def _generate(post_id):
+    try:
+        return len(thumbnails.generate(post_id))
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Generates the thumbnails and srcset variants of post images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='images processed in parallel'
+            )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='regenerate the thumbnails that already exist as well'
+            )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            posts = [
+                post.id for post in posts.prefetch_related('thumbnails')
+                if thumbnails.missing(post)
+                ]
+        else:
+            posts = list(posts.values_list('id', flat=True))
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                made = sum(pool.map(_generate, posts))
+        else:
+            made = sum(len(thumbnails.generate(post_id)) for post_id in posts)
+        self.stdout.write(f'posts: {len(posts)}, thumbnails: {made}')
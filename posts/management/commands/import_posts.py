@@ -0,0 +1,406 @@
+import csv
+import json
+import os
+import posixpath
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import chain, islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import counters, feed, images, search
+from posts.models import Follow, Group, Post, TimelineEntry, User
+from posts.signals import invalidate_pages
+from posts.storage import IMAGE_DIRECTORY
+
+
+def read_jsonl(path):
+    """(record, error) per non-blank line"""
+    with open(path, encoding='utf-8') as source:
+        for line in source:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                yield None, f'не JSON: {error}'
+                continue
+            if not isinstance(record, dict):
+                yield None, 'не объект JSON'
+                continue
+            yield record, None
+
+
+def read_csv(path):
+    """(record, error) per row, empty cells as missing"""
+    with open(path, encoding='utf-8', newline='') as source:
+        for row in csv.DictReader(source):
+            yield {key: value for key, value in row.items() if value}, None
+
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv}
+FIELDS = ('text', 'author', 'group', 'pub_date', 'image')
+
+
+def copy_image(directory, relative):
+    """(stored name, error) of an image of the source directory
+
+    Runs in the worker processes: the image goes through the same checks
+    and downscaling as an upload and is stored by content.
+    """
+    root = os.path.realpath(directory)
+    path = os.path.realpath(os.path.join(root, relative))
+    if not path.startswith(root + os.sep):
+        return None, f'{relative}: вне каталога картинок'
+    filename = os.path.basename(path)
+    try:
+        with open(path, 'rb') as source:
+            upload = images.ingest(File(source, name=filename))
+            return default_storage.save(
+                posixpath.join(IMAGE_DIRECTORY, filename), upload
+                ), None
+    except ValidationError as error:
+        return None, f'{relative}: {"; ".join(error.messages)}'
+    except Exception as error:
+        return None, f'{relative}: {error}'
+
+
+class Checkpoint:
+
+    """how many records of a source are imported, in a JSON file
+
+    Before a batch commits, the file names the records it holds and the
+    last post id before it, so a crash between the commit and the next
+    write can be told from a crash before the commit.
+    """
+
+    def __init__(self, path, source, restart=False):
+        self.path = path
+        self.state = {
+            'source': os.path.abspath(source), 'done': 0,
+            'pending': None, 'after_id': None,
+            }
+        if restart or not os.path.exists(path):
+            return
+        with open(path) as checkpoint:
+            state = json.load(checkpoint)
+        if state.get('source') != self.state['source']:
+            raise CommandError(
+                f'{path} is the checkpoint of {state.get("source")}'
+                )
+        self.state = state
+
+    def __getitem__(self, name):
+        return self.state[name]
+
+    def save(self, **changes):
+        self.state.update(changes)
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as checkpoint:
+            json.dump(self.state, checkpoint)
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+        os.replace(temporary, self.path)
+
+
+class Command(BaseCommand):
+    help = ('Imports posts from a JSONL or CSV file with text, author, '
+            'group, pub_date and image fields, resuming from a checkpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSONL or CSV file of posts')
+        parser.add_argument(
+            '--format', choices=sorted(READERS),
+            help='format of the file, by default from its extension'
+            )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='records written per transaction'
+            )
+        parser.add_argument(
+            '--images',
+            help='directory the image fields of the records are relative to'
+            )
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='processes copying images in parallel'
+            )
+        parser.add_argument(
+            '--create-missing', action='store_true',
+            help='create unknown authors and groups instead of skipping '
+                 'their records'
+            )
+        parser.add_argument(
+            '--skip-search', action='store_true',
+            help='do not index the imported posts for search'
+            )
+        parser.add_argument(
+            '--checkpoint',
+            help='checkpoint file, PATH.checkpoint by default'
+            )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='ignore the checkpoint and import the file from the start'
+            )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format_ = options['format'] or os.path.splitext(path)[1][1:].lower()
+        if format_ not in READERS:
+            raise CommandError(f'unknown format of {path}, pass --format')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        checkpoint = Checkpoint(
+            options['checkpoint'] or path + '.checkpoint', path,
+            options['restart']
+            )
+        self.options = options
+        self.authors = {}
+        self.groups = {}
+        self.imported = self.skipped = 0
+
+        records = enumerate(READERS[format_](path), 1)
+        done = checkpoint['done']
+        for _ in islice(records, done):
+            pass
+        if checkpoint['pending']:
+            batch = list(islice(records, checkpoint['pending'] - done))
+            if self.committed(batch, checkpoint['after_id']):
+                done = checkpoint['pending']
+                checkpoint.save(done=done, pending=None)
+            else:
+                records = chain(batch, records)
+        if done:
+            self.stdout.write(f'resuming after record {done}')
+
+        pool = None
+        if options['images'] and options['workers'] > 1:
+            pool = ProcessPoolExecutor(
+                options['workers'], initializer=django.setup
+                )
+        try:
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                self.import_batch(batch, pool, checkpoint, done)
+                done += len(batch)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'records: {done}')
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self.stdout.write(
+            f'imported: {self.imported}, skipped: {self.skipped}'
+            )
+        if options['images'] and self.imported:
+            self.stdout.write(
+                'thumbnails of the imported images are made on first view '
+                'or by the generate_thumbnails command'
+                )
+
+    def committed(self, batch, after_id):
+        """whether the batch of a crashed run was committed: its posts
+        are the only ones after after_id with its texts and authors
+        """
+        records = [record for _, (record, _) in batch if record]
+        return Post.objects.filter(
+            id__gt=after_id or 0,
+            text__in={record.get('text') for record in records},
+            author__username__in={record.get('author') for record in records}
+            ).exists()
+
+    def skip(self, number, reason):
+        self.skipped += 1
+        self.stderr.write(f'record {number}: {reason}')
+
+    def parse(self, batch):
+        """(number, record) of the records with a text and an author"""
+        valid = []
+        for number, (record, error) in batch:
+            if error is None:
+                wrong = [
+                    name for name in FIELDS if record.get(name) is not None
+                    and not isinstance(record[name], str)
+                    ]
+                if wrong:
+                    error = f'не строка: {", ".join(wrong)}'
+            if error is None and not (record.get('text') or '').strip():
+                error = 'нет текста'
+            if error is None and not record.get('author'):
+                error = 'нет автора'
+            pub_date = record and record.get('pub_date')
+            if error is None and pub_date:
+                try:
+                    parsed = parse_datetime(pub_date)
+                except ValueError:
+                    parsed = None
+                if parsed is None:
+                    error = f'дата {pub_date} не в формате ISO 8601'
+                elif timezone.is_naive(parsed):
+                    parsed = timezone.make_aware(parsed)
+                record['pub_date'] = parsed
+            if error is not None:
+                self.skip(number, error)
+                continue
+            valid.append((number, record))
+        return valid
+
+    def resolve(self, model, field, lookup, names):
+        """fills the lookup map with the ids of names, creating the
+        missing rows with --create-missing
+        """
+        missing = set(names) - set(lookup) - {None}
+        if not missing:
+            return
+        lookup.update(model.objects.filter(
+            **{field + '__in': missing}
+            ).values_list(field, 'id'))
+        missing -= set(lookup)
+        if missing and self.options['create_missing']:
+            if model is User:
+                password = make_password(None)
+                rows = (User(username=name, password=password)
+                        for name in missing)
+            else:
+                rows = (Group(title=name, slug=name, description='')
+                        for name in missing)
+            model.objects.bulk_create(rows)
+            lookup.update(model.objects.filter(
+                **{field + '__in': missing}
+                ).values_list(field, 'id'))
+
+    def copy_images(self, records, pool):
+        """stored image names by the image fields of the records"""
+        paths = sorted({
+            record['image'] for _, record in records if record.get('image')
+            })
+        if not paths or not self.options['images']:
+            return {}
+        copy = partial(copy_image, self.options['images'])
+        copied = pool.map(copy, paths) if pool else map(copy, paths)
+        return dict(zip(paths, copied))
+
+    def import_batch(self, batch, pool, checkpoint, done):
+        records = self.parse(batch)
+        # copied before the transaction: the database stays unlocked
+        # while the files are read, checked and written
+        copied = self.copy_images(records, pool)
+        # counted as soon as they are copied, so a collect of a file
+        # shared with other posts cannot delete it under the batch; the
+        # records not written give theirs back
+        held = {}
+        for number, record in records:
+            name, _ = copied.get(record.get('image'), (None, None))
+            if name:
+                held[number] = name
+        for name, count in Counter(held.values()).items():
+            images.acquire(name, count)
+        checkpoint.save(
+            pending=done + len(batch),
+            after_id=Post.objects.aggregate(last=Max('id'))['last'] or 0
+            )
+        written = ()
+        try:
+            posts, written = self.write_batch(records, copied, checkpoint)
+        finally:
+            for number, name in held.items():
+                if number not in written:
+                    images.release(name)
+        checkpoint.save(done=done + len(batch), pending=None)
+        invalidate_pages(
+            {post.author_id for post in posts},
+            {post.group_id for post in posts}
+            )
+        self.imported += len(posts)
+
+    def write_batch(self, records, copied, checkpoint):
+        """the posts of the records written in one transaction and the
+        numbers of their records
+        """
+        with transaction.atomic():
+            self.resolve(
+                User, 'username', self.authors,
+                [record['author'] for _, record in records]
+                )
+            self.resolve(
+                Group, 'slug', self.groups,
+                [record.get('group') for _, record in records]
+                )
+            posts, numbers = [], []
+            for number, record in records:
+                author_id = self.authors.get(record['author'])
+                group = record.get('group')
+                name, error = copied.get(record.get('image'), ('', None))
+                if author_id is None:
+                    error = f'нет автора {record["author"]}'
+                elif group and group not in self.groups:
+                    error = f'нет группы {group}'
+                elif record.get('image') and not self.options['images']:
+                    error = 'картинка без --images'
+                if error is not None:
+                    self.skip(number, error)
+                    continue
+                pub_date = record.get('pub_date') or timezone.now()
+                posts.append(Post(
+                    text=record['text'], author_id=author_id,
+                    group_id=self.groups.get(group), image=name,
+                    pub_date=pub_date, updated=pub_date
+                    ))
+                numbers.append(number)
+            self.write(posts, checkpoint['after_id'])
+        return posts, set(numbers)
+
+    def write(self, posts, after_id):
+        """the posts and what their signals would have kept in step"""
+        if not posts:
+            return
+        authors = Counter(post.author_id for post in posts)
+        pushed = {
+            author for author in authors if feed.should_fan_out(author)
+            }
+        for post in posts:
+            post.fanned_out = post.author_id in pushed
+        dates = [post.pub_date for post in posts]
+        Post.objects.bulk_create(posts)
+        if posts[0].pk is None:
+            # the backend does not return the ids of bulk inserts
+            ids = list(Post.objects.filter(
+                id__gt=after_id, author_id__in=authors
+                ).order_by('id').values_list('id', flat=True))
+            if len(ids) != len(posts):
+                raise CommandError('posts were added while importing')
+            for post, pk in zip(posts, ids):
+                post.pk = pk
+        # the insert stamps both dates with now, the source ones are set
+        # afterwards rather than switching auto_now off for the process
+        for post, date in zip(posts, dates):
+            post.pub_date = post.updated = date
+        Post.objects.bulk_update(posts, ['pub_date', 'updated'])
+
+        followers = defaultdict(list)
+        for user, author in Follow.objects.filter(
+                author_id__in=pushed).values_list('user_id', 'author_id'):
+            followers[author].append(user)
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(
+                user_id=user, post_id=post.pk, pub_date=post.pub_date
+                )
+             for post in posts for user in followers[post.author_id]),
+            ignore_conflicts=True
+            )
+        for author, count in authors.items():
+            counters.bump_author(author, posts_count=count)
+        if not self.options['skip_search']:
+            for post in posts:
+                search.index_post(post)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.search import index_post
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of post texts'
+
+    def handle(self, *args, **options):
+        indexed = 0
+        for post in Post.objects.only('id', 'text').iterator():
+            index_post(post)
+            indexed += 1
+        self.stdout.write(f'indexed posts: {indexed}')
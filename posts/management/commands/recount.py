@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import recount_authors, recount_posts
+
+
+class Command(BaseCommand):
+    help = 'Repairs drift of the stored post, comment and follow counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='rows updated per transaction'
+            )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = recount_posts(batch_size)
+        self.stdout.write(f'posts with a fixed comment count: {posts}')
+        authors = recount_authors(batch_size)
+        self.stdout.write(f'authors with fixed counters: {authors}')
@@ -0,0 +1,204 @@
+import random
+from collections import defaultdict
+from io import BytesIO
+from itertools import accumulate
+
+from PIL import Image
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import images, thumbnails
+from posts.counters import recount_authors, recount_posts
+from posts.feed import fanout_threshold
+from posts.models import Comment, Follow, Group, Post, TimelineEntry, User
+from posts.search import index_post
+
+WORDS = (
+    'день', 'город', 'утро', 'кофе', 'книга', 'море', 'дорога', 'снег',
+    'поезд', 'окно', 'кошка', 'лес', 'музыка', 'ветер', 'дом', 'работа',
+    'вечер', 'друг', 'река', 'небо', 'письмо', 'сад', 'чай', 'мост',
+)
+# distinct pictures the images of the posts are drawn from
+PICTURES = 4
+
+
+def zipf_weights(count, alpha):
+    """weights of a power law over ranks 1..count"""
+    return [1 / rank ** alpha for rank in range(1, count + 1)]
+
+
+def sentence(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def picture(rng):
+    """a JPEG of one random colour"""
+    color = tuple(rng.randrange(256) for _ in range(3))
+    data = BytesIO()
+    Image.new('RGB', (640, 360), color).save(data, 'JPEG')
+    return ContentFile(data.getvalue())
+
+
+class Command(BaseCommand):
+    help = ('Fills the database with generated users, groups, posts, '
+            'comments and a power-law follow graph for benchmarks')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument(
+            '--images', type=float, default=0,
+            help='share of the posts with an image, thumbnails generated'
+            )
+        parser.add_argument(
+            '--alpha', type=float, default=1.1,
+            help='exponent of the power law of authors and posts'
+            )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='random seed, the same seed gives the same dataset'
+            )
+        parser.add_argument(
+            '--prefix', default='bench',
+            help='username prefix of the generated users'
+            )
+        parser.add_argument(
+            '--password', default='bench-password',
+            help='password of every generated user'
+            )
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='rows per INSERT, by default the most the database takes'
+            )
+        parser.add_argument(
+            '--skip-search', action='store_true',
+            help='do not index the generated posts for search'
+            )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        prefix = options['prefix']
+
+        with transaction.atomic():
+            password = make_password(options['password'])
+            User.objects.bulk_create(
+                (User(username=f'{prefix}{n}', password=password)
+                 for n in range(options['users'])),
+                batch_size=batch_size
+                )
+            # ranked by id: the first users are the popular, prolific ones
+            users = list(User.objects.filter(
+                username__startswith=prefix
+                ).order_by('id').values_list('id', flat=True))
+            Group.objects.bulk_create(
+                (Group(title=f'Группа {n}', slug=f'{prefix}-group-{n}',
+                       description=sentence(rng, 5, 20))
+                 for n in range(options['groups'])),
+                batch_size=batch_size
+                )
+            groups = list(Group.objects.filter(
+                slug__startswith=f'{prefix}-group-'
+                ).values_list('id', flat=True)) + [None]
+
+            author_weights = zipf_weights(len(users), options['alpha'])
+            authors = rng.choices(users, author_weights, k=options['posts'])
+            Post.objects.bulk_create(
+                (Post(text=sentence(rng, 5, 60), author_id=author,
+                      group_id=rng.choice(groups))
+                 for author in authors),
+                batch_size=batch_size
+                )
+            posts = list(Post.objects.filter(
+                author_id__in=users
+                ).order_by('id').values_list('id', 'author_id', 'pub_date'))
+
+            post_weights = zipf_weights(len(posts), options['alpha'])
+            rng.shuffle(post_weights)
+            Comment.objects.bulk_create(
+                (Comment(post_id=post_id, author_id=rng.choice(users),
+                         text=sentence(rng, 2, 20))
+                 for post_id, *_ in rng.choices(
+                     posts, post_weights, k=options['comments'])),
+                batch_size=batch_size
+                )
+
+            edges = set()
+            limit = min(options['follows'], len(users) * (len(users) - 1))
+            cumulative = list(accumulate(author_weights))
+            while len(edges) < limit:
+                author = rng.choices(users, cum_weights=cumulative)[0]
+                follower = rng.choice(users)
+                if follower != author:
+                    edges.add((follower, author))
+            Follow.objects.bulk_create(
+                (Follow(user_id=user, author_id=author)
+                 for user, author in edges),
+                batch_size=batch_size, ignore_conflicts=True
+                )
+
+            self.fan_out(posts, edges, batch_size)
+            recount_posts(batch_size or 1000)
+            recount_authors(batch_size or 1000)
+
+        with_images = 0
+        if options['images']:
+            with_images = self.add_images(rng, posts, options['images'])
+        if not options['skip_search']:
+            for post in Post.objects.filter(
+                    author_id__in=users).only('id', 'text').iterator():
+                index_post(post)
+        # the rows bypassed the signals that bump the cache generations
+        cache.clear()
+        self.stdout.write(
+            f'users: {len(users)}, groups: {len(groups) - 1}, '
+            f'posts: {len(posts)}, comments: {options["comments"]}, '
+            f'follows: {len(edges)}, images: {with_images}'
+            )
+
+    def add_images(self, rng, posts, share):
+        """images of a share of the posts, stored by content and with
+        their thumbnails recorded, as the worker leaves an upload
+        """
+        chosen = [post_id for post_id, *_ in posts if rng.random() < share]
+        names = [
+            default_storage.save('posts/seed.jpg', picture(rng))
+            for _ in range(PICTURES)
+            ]
+        by_name = defaultdict(list)
+        for post_id in chosen:
+            by_name[rng.choice(names)].append(post_id)
+        for name, ids in by_name.items():
+            Post.objects.filter(id__in=ids).update(image=name)
+            images.acquire(name, len(ids))
+        for post_id in chosen:
+            thumbnails.generate(post_id)
+        return len(chosen)
+
+    def fan_out(self, posts, edges, batch_size):
+        """timelines as the post signals would have built them"""
+        followers = defaultdict(list)
+        for user, author in edges:
+            followers[author].append(user)
+        pulled = {
+            author for author, users in followers.items()
+            if len(users) >= fanout_threshold()
+            }
+        by_author = defaultdict(list)
+        for post_id, author, pub_date in posts:
+            by_author[author].append((post_id, pub_date))
+        Post.objects.filter(author_id__in=pulled).update(fanned_out=False)
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=user, post_id=post_id, pub_date=pub_date)
+             for author, users in followers.items() if author not in pulled
+             for user in users
+             for post_id, pub_date in by_author[author]),
+            batch_size=batch_size, ignore_conflicts=True
+            )
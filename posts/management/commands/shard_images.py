@@ -0,0 +1,70 @@
+import posixpath
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts import images
+from posts.models import Post, PostThumbnail
+from posts.storage import IMAGE_DIRECTORY, SHARDED_IMAGE_REGEX
+
+
+class Command(BaseCommand):
+    help = ('Moves post images into the sharded posts/ab/cd/ layout; '
+            'safe to interrupt and run again')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='posts moved per transaction'
+            )
+        parser.add_argument(
+            '--keep-old', action='store_true',
+            help='leave the files at their old paths'
+            )
+
+    def handle(self, *args, **options):
+        pending = Post.objects.exclude(image='').exclude(
+            image__isnull=True
+            ).exclude(image__regex=SHARDED_IMAGE_REGEX).order_by('id')
+        moved = missing = 0
+        last_id = 0
+        while True:
+            batch = list(
+                pending.filter(id__gt=last_id).values_list('id', 'image')[
+                    :options['batch_size']
+                    ]
+                )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            renamed = {}
+            for post_id, old in batch:
+                if not default_storage.exists(old):
+                    missing += 1
+                    continue
+                # copy first: the old path keeps serving until the row
+                # points at the new one
+                with default_storage.open(old) as content:
+                    renamed[post_id] = (old, default_storage.save(
+                        posixpath.join(IMAGE_DIRECTORY, posixpath.basename(old)),
+                        content
+                        ))
+            stale = []
+            with transaction.atomic():
+                for post_id, (old, new) in renamed.items():
+                    if Post.objects.filter(id=post_id, image=old).update(
+                            image=new, updated=timezone.now()):
+                        PostThumbnail.objects.filter(
+                            post_id=post_id, source=old
+                            ).update(source=new)
+                        images.acquire(new)
+                        stale.append(old)
+                        moved += 1
+            if not options['keep_old']:
+                for old in stale:
+                    if not Post.objects.filter(image=old).exists():
+                        default_storage.delete(old)
+            self.stdout.write(f'moved: {moved}, up to post {last_id}')
+        self.stdout.write(f'images moved: {moved}, missing files: {missing}')
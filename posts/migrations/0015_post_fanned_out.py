@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 04:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='fanned_out',
+            field=models.BooleanField(default=True, editable=False, help_text='Пост разослан в ленты подписчиков', verbose_name='Разослан'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.28 on 2026-10-17 04:05
+
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_posts(apps, schema_editor):
+    from posts.search import tokenize
+    Post = apps.get_model('posts', 'Post')
+    SearchDocument = apps.get_model('posts', 'SearchDocument')
+    SearchPosting = apps.get_model('posts', 'SearchPosting')
+    for post in Post.objects.only('id', 'text').iterator():
+        frequencies = Counter(tokenize(post.text))
+        document = SearchDocument.objects.create(
+            post_id=post.id, length=sum(frequencies.values())
+            )
+        SearchPosting.objects.bulk_create(
+            [SearchPosting(document=document, term=term, frequency=count)
+             for term, count in frequencies.items()],
+            batch_size=500
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='posts.Post')),
+                ('length', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100)),
+                ('frequency', models.PositiveIntegerField(default=1)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='posts.SearchDocument')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchposting',
+            constraint=models.UniqueConstraint(fields=('term', 'document'), name='unique_search_posting'),
+        ),
+        migrations.RunPython(index_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-17 04:09
+
+from django.db import migrations
+
+
+def install_fts(apps, schema_editor):
+    from posts import fts
+    fts.install(schema_editor.connection)
+
+
+def uninstall_fts(apps, schema_editor):
+    from posts import fts
+    fts.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_fts, uninstall_fts),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-17 04:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_postthumbnail'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='postthumbnail',
+            name='unique_post_thumbnail',
+        ),
+        migrations.AddField(
+            model_name='postthumbnail',
+            name='format',
+            field=models.CharField(default='JPEG', max_length=10),
+        ),
+        migrations.AddConstraint(
+            model_name='postthumbnail',
+            constraint=models.UniqueConstraint(fields=('post', 'geometry', 'format'), name='unique_post_thumbnail_format'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.28 on 2026-10-17 04:21
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_references(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    StoredImage = apps.get_model('posts', 'StoredImage')
+    images = Post.objects.filter(
+        image__regex=r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/'
+        ).order_by().values_list('image').annotate(refs=Count('id'))
+    StoredImage.objects.bulk_create(
+        [StoredImage(name=name, refs=refs) for name, refs in images],
+        batch_size=500
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_postthumbnail_format'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('refs', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
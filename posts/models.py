@@ -1,4 +1,8 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
 from django.db import models
+from django.db.models import prefetch_related_objects
+from django.db.models.query import BaseIterable, ModelIterable
 from django.contrib.auth import get_user_model
 from .validators import validate_not_empty
 from pytils.translit import slugify
@@ -29,6 +33,71 @@ class Group(models.Model):
         super().save(*args, **kwargs)
 
 
+# the columns a post card shows, and what its cache version is made of
+CARD_FIELDS = (
+    'text', 'pub_date', 'updated', 'image', 'comment_count',
+    'author__username', 'group__title', 'group__slug',
+    )
+
+
+class FeedIterable(ModelIterable):
+
+    """posts, then the thumbnails of the ones with an image in one query"""
+
+    def __iter__(self):
+        posts = list(super().__iter__())
+        prefetch_related_objects(
+            [post for post in posts if post.image], 'thumbnails'
+            )
+        return iter(posts)
+
+
+class FeedRowIterable(BaseIterable):
+
+    """FeedRow objects built from plain tuples of the card columns"""
+
+    def __iter__(self):
+        image = Post._meta.get_field('image')
+        rows = []
+        for values in self.queryset.values_list(
+                'id', 'author_id', 'group_id', *CARD_FIELDS):
+            (id_, author_id, group_id, text, pub_date, updated, name,
+             comment_count, username, title, slug) = values
+            rows.append(FeedRow(
+                id_, text, pub_date, updated,
+                image.attr_class(None, image, name or ''), comment_count,
+                FeedAuthor(author_id, username),
+                FeedGroup(group_id, title, slug) if group_id else None
+                ))
+        with_image = {row.id: row for row in rows if row.image}
+        for thumbnail in PostThumbnail.objects.filter(
+                post_id__in=with_image):
+            with_image[thumbnail.post_id].thumbnails.append(thumbnail)
+        return iter(rows)
+
+
+class FeedQuerySet(models.QuerySet):
+
+    """posts as the cards of the list pages need them"""
+
+    def feed(self):
+        """the author and the group in the same query, only the columns
+        of the card and the thumbnails in one more query; the comment
+        count is the stored counter. POSTS_FEED_ROWS switches to rows()
+        """
+        queryset = self.select_related('author', 'group').only(*CARD_FIELDS)
+        queryset._iterable_class = FeedIterable
+        if getattr(settings, 'POSTS_FEED_ROWS', False):
+            return queryset.rows()
+        return queryset
+
+    def rows(self):
+        """slotted FeedRow objects instead of model instances"""
+        queryset = self._chain()
+        queryset._iterable_class = FeedRowIterable
+        return queryset
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст',
@@ -57,13 +126,108 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True, null=True
         )
+    updated = models.DateTimeField(
+        "date updated",
+        auto_now=True
+        )
+    comment_count = models.PositiveIntegerField(
+        verbose_name='Комментариев',
+        default=0,
+        editable=False
+        )
+    fanned_out = models.BooleanField(
+        verbose_name='Разослан',
+        default=True,
+        editable=False,
+        help_text='Пост разослан в ленты подписчиков'
+        )
+
+    objects = FeedQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id']),
+            models.Index(fields=['group', '-pub_date', '-id']),
+            models.Index(fields=['author', '-pub_date', '-id']),
+            models.Index(
+                fields=['author'], condition=models.Q(fanned_out=False),
+                name='posts_post_pulled_author_idx'
+                ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def card_version(self):
+        """changes whenever something shown on the post card changes"""
+        return '{}.{}.{}.{}'.format(
+            self.updated.timestamp() if self.updated else 0,
+            self.comment_count,
+            self.author_id,
+            self.group_id
+            )
+
+
+class FeedAuthor:
+    __slots__ = ('id', 'username')
+
+    def __init__(self, id_, username):
+        self.id = id_
+        self.username = username
+
+    def __str__(self):
+        return self.username
+
+
+class FeedGroup:
+    __slots__ = ('id', 'title', 'slug')
+
+    def __init__(self, id_, title, slug):
+        self.id = id_
+        self.title = title
+        self.slug = slug
+
+    def __str__(self):
+        return self.title
+
+
+class Thumbnails(list):
+
+    """prefetched thumbnails, read like post.thumbnails"""
+
+    def all(self):
+        return self
+
+
+class FeedRow:
+
+    """a post of a list page, read only, without a model instance"""
+
+    __slots__ = (
+        'id', 'text', 'pub_date', 'updated', 'image', 'comment_count',
+        'author', 'group', 'thumbnails',
+        )
+
+    def __init__(self, id_, text, pub_date, updated, image, comment_count,
+                 author, group):
+        self.id = id_
+        self.text = text
+        self.pub_date = pub_date
+        self.updated = updated
+        self.image = image
+        self.comment_count = comment_count
+        self.author = author
+        self.group = group
+        self.thumbnails = Thumbnails()
+
+    pk = property(lambda self: self.id)
+    author_id = property(lambda self: self.author.id)
+    group_id = property(lambda self: self.group.id if self.group else None)
+    card_version = Post.card_version
+    __str__ = Post.__str__
+
 
 class Comment(models.Model):
 
@@ -103,3 +267,120 @@ class Follow(models.Model):
                 name='unique_follow'
                 )
         ]
+
+
+class PostThumbnail(models.Model):
+
+    """a pre-generated thumbnail of a post image"""
+
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE,
+        related_name='thumbnails'
+        )
+    geometry = models.CharField(max_length=50)
+    format = models.CharField(max_length=10, default='JPEG')
+    source = models.CharField(max_length=255)
+    name = models.CharField(max_length=255)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'geometry', 'format'],
+                name='unique_post_thumbnail_format'
+                )
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def url(self):
+        return default_storage.url(self.name)
+
+
+class StoredImage(models.Model):
+
+    """a content-addressed image file and the number of posts using it"""
+
+    name = models.CharField(max_length=255, unique=True)
+    refs = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
+class AuthorStats(models.Model):
+
+    """stored post and follow counters of a user"""
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+        )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.user)
+
+
+class TimelineEntry(models.Model):
+
+    """a post delivered to the follow feed of a user
+
+    pub_date is a copy of the post's, so a page of the feed is read along
+    the (user, -pub_date) index of the timeline alone.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='timeline')
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name='timeline')
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_entry'
+                )
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post']),
+        ]
+
+
+class SearchDocument(models.Model):
+
+    """a post in the full-text search index"""
+
+    post = models.OneToOneField(
+        Post, on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document'
+        )
+    length = models.PositiveIntegerField(default=0)
+
+
+class SearchPosting(models.Model):
+
+    """occurrences of a stemmed term in an indexed post"""
+
+    document = models.ForeignKey(
+        SearchDocument, on_delete=models.CASCADE,
+        related_name='postings'
+        )
+    term = models.CharField(max_length=100)
+    frequency = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['term', 'document'],
+                name='unique_search_posting'
+                )
+        ]
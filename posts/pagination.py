@@ -0,0 +1,166 @@
+import base64
+import binascii
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .caching import get_or_build
+
+
+def encode_cursor(post):
+    """opaque token pointing at the (pub_date, id) position of a post"""
+    raw = '{}|{}'.format(post.pub_date.isoformat(), post.id)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(pub_date, id) from a token, or None if the token is malformed"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        pub_date, post_id = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        post_id = int(post_id)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, post_id
+
+
+class CursorPage(Sequence):
+
+    """a page of posts addressed by keyset cursors instead of a number"""
+
+    is_cursor = True
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<CursorPage of {} posts>'.format(len(self))
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return encode_cursor(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return encode_cursor(self.object_list[0])
+        return None
+
+
+class CursorPaginator:
+
+    """keyset pagination over (pub_date, id), newest first
+
+    Every page is a range scan starting right after the cursor, so its
+    cost does not depend on how deep the page is. There is no COUNT(*)
+    and therefore no page numbers.
+    """
+
+    def __init__(self, object_list, per_page):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+
+    def get_page(self, after=None, before=None):
+        """page after/before the given tokens, the first page otherwise"""
+        after = decode_cursor(after)
+        before = decode_cursor(before) if after is None else None
+        limit = self.per_page + 1
+        if before is not None:
+            pub_date, post_id = before
+            posts = list(
+                self.object_list.filter(
+                    Q(pub_date__gt=pub_date)
+                    | Q(pub_date=pub_date, id__gt=post_id)
+                    ).order_by('pub_date', 'id')[:limit]
+                )
+            has_previous = len(posts) > self.per_page
+            posts = posts[:self.per_page]
+            posts.reverse()
+            return CursorPage(posts, True, has_previous)
+        posts = self.object_list.order_by('-pub_date', '-id')
+        if after is not None:
+            pub_date, post_id = after
+            posts = posts.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, id__lt=post_id)
+                )
+        posts = list(posts[:limit])
+        has_next = len(posts) > self.per_page
+        return CursorPage(posts[:self.per_page], has_next, after is not None)
+
+
+def cached_count(queryset, key, timeout=None):
+    """COUNT(*) of a queryset, remembered under key and run once at a time"""
+    return get_or_build(key, queryset.count, timeout)
+
+
+def page_window(page, paginator, size=None):
+    """page numbers to link: first, last and the ones around the current
+
+    Gaps are marked with None, so a page of a huge list renders a handful
+    of links instead of one per page.
+    """
+    if size is None:
+        size = getattr(settings, 'POSTS_PAGINATOR_WINDOW', 2)
+    last = paginator.num_pages
+    start = max(page.number - size, 1)
+    end = min(page.number + size, last)
+    window = []
+    if start > 1:
+        window.append(1)
+        if start > 2:
+            window.append(None)
+    window.extend(range(start, end + 1))
+    if end < last:
+        if end < last - 1:
+            window.append(None)
+        window.append(last)
+    return window
+
+
+def paginate(request, queryset, per_page, count=None):
+    """paginator and page for a list view
+
+    ?after=/?before= tokens or POSTS_PAGINATION = 'cursor' select the
+    keyset paginator, otherwise the numbered one is used so old ?page=N
+    links keep working. count, a number or a callable, replaces the
+    paginator's COUNT(*) with a stored or cached total.
+    """
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    mode = getattr(settings, 'POSTS_PAGINATION', 'page')
+    if after or before or (mode == 'cursor' and 'page' not in request.GET):
+        paginator = CursorPaginator(queryset, per_page)
+        return paginator, paginator.get_page(after=after, before=before)
+    paginator = Paginator(queryset, per_page)
+    if count is not None:
+        paginator.count = count() if callable(count) else count
+    return paginator, paginator.get_page(request.GET.get('page'))
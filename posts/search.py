@@ -0,0 +1,322 @@
+import hashlib
+import math
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Avg, Count
+from django.utils.module_loading import import_string
+
+from . import fts
+from .caching import get_or_build
+from .models import Post, SearchDocument, SearchPosting
+
+WORD_RE = re.compile(r'\w+')
+
+VOWELS = 'аеиоуыэюя'
+
+STOP_WORDS = frozenset((
+    'и в во не что он на я с со как а то все она так его но да ты к у же '
+    'вы за бы по только ее мне было вот от меня еще нет о из ему теперь '
+    'когда даже ну вдруг ли если уже или ни быть был него до вас нибудь '
+    'опять уж вам ведь там потом себя ничего ей может они тут где есть '
+    'надо ней для мы тебя их чем была сам чтоб без будто чего раз тоже '
+    'себе под будет ж тогда кто этот того потому этого какой совсем ним '
+    'здесь этом один почти мой тем чтобы нее были куда зачем всех никогда '
+    'можно при наконец два об другой хоть после над больше тот через эти '
+    'нас про всего них какая много разве три эту моя впрочем хорошо свою '
+    'этой перед иногда лучше чуть том нельзя такой им более всегда конечно '
+    'всю между'
+    ).split())
+
+PERFECTIVE_GERUND = (
+    ('вшись', 'вши', 'в'),
+    ('ывшись', 'ившись', 'ывши', 'ивши', 'ыв', 'ив'),
+    )
+REFLEXIVE = ('ся', 'сь')
+ADJECTIVE = (
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое', 'ей',
+    'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую', 'юю', 'ая',
+    'яя', 'ою', 'ею',
+    )
+PARTICIPLE = (
+    ('ем', 'нн', 'вш', 'ющ', 'щ'),
+    ('ивш', 'ывш', 'ующ'),
+    )
+VERB = (
+    ('ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но', 'ет',
+     'ют', 'ны', 'ть', 'й', 'л', 'н'),
+    ('ейте', 'уйте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило', 'ыло',
+     'ено', 'ует', 'уют', 'ены', 'ить', 'ыть', 'ишь', 'ей', 'уй', 'ил', 'ыл',
+     'им', 'ым', 'ен', 'ят', 'ит', 'ыт', 'ую', 'ю'),
+    )
+NOUN = (
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ие', 'ье',
+    'еи', 'ии', 'ей', 'ой', 'ий', 'ям', 'ем', 'ам', 'ом', 'ах', 'ях', 'ию',
+    'ью', 'ия', 'ья', 'а', 'е', 'и', 'й', 'о', 'у', 'ы', 'ь', 'ю', 'я',
+    )
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+
+def _longest(endings):
+    return tuple(sorted(endings, key=len, reverse=True))
+
+
+def _strip(word, start, endings, after_a_ya=False):
+    """word without the longest of endings found at or after start"""
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            cut = len(word) - len(ending)
+            if after_a_ya:
+                if cut - 1 < start or word[cut - 1] not in 'ая':
+                    continue
+            return word[:cut]
+    return None
+
+
+def _strip_grouped(word, start, groups):
+    """the first group is only removed after а/я, like in Snowball"""
+    candidates = []
+    for after_a_ya, endings in zip((True, False), groups):
+        for ending in endings:
+            stripped = _strip(word, start, (ending,), after_a_ya)
+            if stripped is not None:
+                candidates.append(stripped)
+    return min(candidates, key=len) if candidates else None
+
+
+def _regions(word):
+    rv = r1 = r2 = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+@lru_cache(maxsize=50000)
+def stem(word):
+    """Snowball (Porter) stemmer for Russian, other words are kept as is"""
+    if not re.fullmatch('[а-я]+', word):
+        return word
+    rv, r2 = _regions(word)
+    stripped = _strip_grouped(word, rv, PERFECTIVE_GERUND)
+    if stripped is None:
+        word = _strip(word, rv, REFLEXIVE) or word
+        stripped = _strip(word, rv, _longest(ADJECTIVE))
+        if stripped is not None:
+            stripped = _strip_grouped(stripped, rv, PARTICIPLE) or stripped
+        else:
+            stripped = _strip_grouped(word, rv, VERB)
+            if stripped is None:
+                stripped = _strip(word, rv, _longest(NOUN))
+    word = stripped if stripped is not None else word
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+    word = _strip(word, r2, DERIVATIONAL) or word
+    if word.endswith('нн') and len(word) - 1 >= rv:
+        return word[:-1]
+    superlative = _strip(word, rv, SUPERLATIVE)
+    if superlative is not None:
+        word = superlative
+        if word.endswith('нн') and len(word) - 1 >= rv:
+            word = word[:-1]
+        return word
+    if word.endswith('ь') and len(word) - 1 >= rv:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    """stemmed search terms of a text, stop words left out"""
+    words = WORD_RE.findall(text.lower().replace('ё', 'е'))
+    return [stem(word)[:100] for word in words if word not in STOP_WORDS]
+
+
+def normalize_query(query):
+    """canonical form of a query, used as its cache key"""
+    return ' '.join(sorted(set(tokenize(query or ''))))
+
+
+def index_post(post):
+    """replaces the postings of a post with the terms of its text"""
+    frequencies = Counter(tokenize(post.text))
+    with transaction.atomic():
+        document, created = SearchDocument.objects.update_or_create(
+            post_id=post.pk, defaults={'length': sum(frequencies.values())}
+            )
+        if not created:
+            document.postings.all().delete()
+        SearchPosting.objects.bulk_create(
+            [SearchPosting(document=document, term=term, frequency=count)
+             for term, count in frequencies.items()],
+            batch_size=500
+            )
+
+
+def _collection_stats():
+    """number of indexed posts and their average length, cached briefly"""
+    stats = get_or_build(
+        'search:stats',
+        lambda: SearchDocument.objects.aggregate(
+            count=Count('pk'), average=Avg('length')
+            ),
+        60
+        )
+    return stats['count'] or 0, stats['average'] or 1.0
+
+
+def rank(terms, postings, documents, average_length, k1=1.2, b=0.75):
+    """post ids ordered by their BM25 score for the terms
+
+    postings are (post id, term, frequency, post length) rows for the
+    terms, which is everything BM25 needs besides the collection stats.
+    """
+    by_term = defaultdict(list)
+    for post_id, term, frequency, length in postings:
+        by_term[term].append((post_id, frequency, length))
+    scores = defaultdict(float)
+    for term in terms:
+        matches = by_term.get(term, ())
+        df = len(matches)
+        idf = math.log(1 + (documents - df + 0.5) / (df + 0.5))
+        for post_id, frequency, length in matches:
+            norm = k1 * (1 - b + b * length / average_length)
+            scores[post_id] += idf * frequency * (k1 + 1) / (frequency + norm)
+    return sorted(scores, key=lambda post_id: (-scores[post_id], -post_id))
+
+
+class InvertedIndexBackend:
+
+    """BM25 over the SearchPosting index with Russian stemming"""
+
+    def normalize(self, query):
+        return normalize_query(query)
+
+    def key(self, normalized):
+        return normalized
+
+    def search(self, normalized, limit):
+        terms = normalized.split()
+        postings = SearchPosting.objects.filter(
+            term__in=terms
+            ).values_list(
+                'document_id', 'term', 'frequency', 'document__length'
+                )
+        documents, average_length = _collection_stats()
+        return rank(terms, postings, documents, average_length)[:limit]
+
+
+class IContainsBackend:
+
+    """substring scan, works on any database
+
+    The query keeps its case: SQLite only ignores the case of ASCII
+    letters, so a lowercased Cyrillic query would miss capitalized text.
+    """
+
+    def normalize(self, query):
+        return ' '.join((query or '').split())
+
+    def key(self, normalized):
+        return normalized
+
+    def search(self, normalized, limit):
+        return list(
+            Post.objects.filter(
+                text__icontains=normalized
+                ).order_by('-pub_date').values_list('id', flat=True)[:limit]
+            )
+
+
+def _fts_mode():
+    return getattr(settings, 'POSTS_SEARCH_FTS_MODE', 'word')
+
+
+class SQLiteFTSBackend:
+
+    """SQLite FTS5 tables kept in sync by triggers (see posts.fts)
+
+    Words are matched by their stem as a prefix, which approximates
+    Russian morphology. Queries without word matches fall back to the
+    trigram table, which also finds parts of words; with
+    POSTS_SEARCH_FTS_MODE = 'trigram' only the trigram table is used.
+    Databases without FTS5 are searched with IContainsBackend, which
+    gets the query as normalized by itself.
+    """
+
+    fallback = IContainsBackend()
+
+    def normalize(self, query):
+        if not fts.available_tables(connection):
+            return self.fallback.normalize(query)
+        words = WORD_RE.findall((query or '').lower().replace('ё', 'е'))
+        return ' '.join(sorted({w for w in words if w not in STOP_WORDS}))
+
+    def key(self, normalized):
+        if not fts.available_tables(connection):
+            return 'fallback:' + self.fallback.key(normalized)
+        return '{}:{}'.format(_fts_mode(), normalized)
+
+    def search(self, normalized, limit):
+        tables = fts.available_tables(connection)
+        if not tables:
+            return self.fallback.search(normalized, limit)
+        words = normalized.split()
+        found = []
+        mode = _fts_mode()
+        if mode != 'trigram' and fts.WORD_TABLE in tables:
+            expression = ' OR '.join('"{}"*'.format(stem(w)) for w in words)
+            found = fts.match(connection, fts.WORD_TABLE, expression, limit)
+        trigrams = [w for w in words if len(w) >= 3]
+        if not found and trigrams and fts.TRIGRAM_TABLE in tables:
+            expression = ' OR '.join('"{}"'.format(w) for w in trigrams)
+            found = fts.match(connection, fts.TRIGRAM_TABLE, expression, limit)
+        return found
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    """the search backend named by POSTS_SEARCH_BACKEND"""
+    return _load_backend(getattr(
+        settings, 'POSTS_SEARCH_BACKEND', 'posts.search.InvertedIndexBackend'
+        ))
+
+
+def search_posts(query):
+    """ids of the posts matching a query, best first
+
+    Results are cached for a short time under the backend and its key
+    of the normalized query, which also names whatever else decides
+    the results, so a repeated search does not touch the index at all.
+    """
+    backend = get_backend()
+    normalized = backend.normalize(query)
+    if not normalized:
+        return []
+    key = 'search:{}:{}'.format(
+        type(backend).__name__,
+        hashlib.md5(backend.key(normalized).encode()).hexdigest()
+        )
+    return get_or_build(
+        key,
+        lambda: backend.search(
+            normalized, getattr(settings, 'POSTS_SEARCH_MAX_RESULTS', 1000)
+            ),
+        getattr(settings, 'POSTS_SEARCH_CACHE_TIMEOUT', 30)
+        )
@@ -0,0 +1,134 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import counters, feed, fts, images, search, thumbnails
+from .caching import author_scope, bump_generation, group_scope
+from .models import Comment, Follow, Group, Post, User
+
+
+def invalidate_pages(author_ids=(), group_ids=(), index=True):
+    """bumps the cached pages that show posts of these authors and groups"""
+    scopes = ['posts'] if index else []
+    author_ids = [pk for pk in author_ids if pk is not None]
+    group_ids = [pk for pk in group_ids if pk is not None]
+    if author_ids:
+        scopes.extend(map(author_scope, User.objects.filter(
+            pk__in=author_ids
+            ).values_list('username', flat=True)))
+    if group_ids:
+        scopes.extend(map(group_scope, Group.objects.filter(
+            pk__in=group_ids
+            ).values_list('slug', flat=True)))
+    bump_generation(*scopes)
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    """remembers the group and the image the post is moving away from"""
+    instance._previous_group_id = None
+    instance._previous_image = None
+    if not raw and instance.pk is not None:
+        previous = Post.objects.filter(
+            pk=instance.pk
+            ).values_list('group_id', 'image').first()
+        if previous is not None:
+            instance._previous_group_id, instance._previous_image = previous
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, raw=False, **kwargs):
+    """counts a new post and fans it out to the follow feeds"""
+    if created and not raw:
+        counters.bump_author(instance.author_id, posts_count=1)
+        feed.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, raw=False, **kwargs):
+    """keeps the search index and the cached pages in step with the post"""
+    if not raw:
+        search.index_post(instance)
+        previous_image = getattr(instance, '_previous_image', None)
+        if instance.image.name != previous_image:
+            images.acquire(instance.image.name)
+            images.release(previous_image)
+            thumbnails.schedule(instance)
+        invalidate_pages(
+            [instance.author_id],
+            [instance.group_id, getattr(instance, '_previous_group_id', None)]
+            )
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_author(instance.author_id, posts_count=-1)
+    images.release(instance.image.name)
+    invalidate_pages([instance.author_id], [instance.group_id])
+
+
+def comment_changed(comment):
+    """comment counts are shown wherever the post is listed"""
+    post = Post.objects.filter(pk=comment.post_id).values_list(
+        'author_id', 'group_id'
+        ).first()
+    if post is not None:
+        invalidate_pages([post[0]], [post[1]])
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_comments(instance.post_id, 1)
+        comment_changed(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+    comment_changed(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    """counts the follow and fills the follower's feed"""
+    if created and not raw:
+        counters.bump_author(instance.author_id, followers_count=1)
+        counters.bump_author(instance.user_id, following_count=1)
+        feed.backfill_timeline(instance.user_id, instance.author_id)
+        invalidate_pages([instance.author_id, instance.user_id], index=False)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """uncounts the follow and drops the author's posts from the feed"""
+    counters.bump_author(instance.author_id, followers_count=-1)
+    counters.bump_author(instance.user_id, following_count=-1)
+    feed.prune_timeline(instance.user_id, instance.author_id)
+    invalidate_pages([instance.author_id, instance.user_id], index=False)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, **kwargs):
+    """group titles and slugs are shown on the cached cards and pages"""
+    bump_generation('post_card', 'pages')
+
+
+@receiver(pre_save, sender=User)
+def user_renamed(sender, instance, raw=False, update_fields=None, **kwargs):
+    """usernames are shown on the cached cards and pages"""
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    old = User.objects.filter(pk=instance.pk).values_list(
+        'username', flat=True
+        ).first()
+    if old is not None and old != instance.username:
+        bump_generation('post_card', 'pages')
+
+
+def restore_fts(sender, using='default', **kwargs):
+    """recreates FTS triggers lost when SQLite rebuilt posts_post"""
+    fts.install(connections[using])
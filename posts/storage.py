@@ -0,0 +1,65 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+IMAGE_DIRECTORY = 'posts'
+SHARDED_IMAGE_REGEX = r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/'
+
+
+def content_hash(content):
+    """sha256 of a file, read in chunks and rewound"""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def sharded_name(content, filename):
+    """posts/ab/cd/<sha256>.<ext> of a file"""
+    digest = content_hash(content)
+    return posixpath.join(
+        IMAGE_DIRECTORY, digest[:2], digest[2:4],
+        digest + os.path.splitext(filename)[1].lower()
+        )
+
+
+class ShardedStorage(FileSystemStorage):
+
+    """FileSystemStorage keeping post images by content hash
+
+    Post.image keeps upload_to='posts/'. Whatever is saved right in that
+    directory is named after the sha256 of its content two levels deeper,
+    so no directory grows past a few dozen entries per million images
+    and identical uploads end up as one file. Saving a file that is
+    already stored only touches it and returns its name; StoredImage
+    counts the posts using it, and images.collect keeps files touched
+    in the last POSTS_IMAGE_COLLECT_GRACE seconds, whose posts may not
+    count them yet.
+    """
+
+    def save(self, name, content, max_length=None):
+        directory, filename = posixpath.split(name)
+        if directory == IMAGE_DIRECTORY:
+            if not hasattr(content, 'chunks'):
+                content = File(content, name)
+            name = sharded_name(content, filename)
+            if self.exists(name):
+                try:
+                    os.utime(self.path(name))
+                except FileNotFoundError:
+                    pass  # collected meanwhile, written again below
+                else:
+                    return name
+            saved = super().save(name, content, max_length=max_length)
+            if saved != name:
+                # a concurrent save wrote the same content first
+                self.delete(saved)
+            return name
+        return super().save(name, content, max_length=max_length)
@@ -0,0 +1,121 @@
+from django import template
+from django.conf import settings
+from django.http import QueryDict
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts import holes, thumbnails
+
+from posts.caching import get_generation, get_or_build
+from posts.pagination import page_window
+
+register = template.Library()
+
+OWNER_BUTTONS = '<!--owner-buttons-->'
+
+
+def card_key(post):
+    return 'post_card:{}'.format(post.id)
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    """the post card, cached per post version
+
+    Everything but the edit/delete buttons is the same for every viewer,
+    so it is rendered once per version of the post and shared by all list
+    pages. The buttons are rendered live for the author only, or left as
+    a hole when the page itself is rendered for the shared cache.
+    """
+    request = context.get('request')
+    generation = getattr(request, '_post_card_generation', None)
+    if generation is None:
+        generation = get_generation('post_card')
+        if request is not None:
+            request._post_card_generation = generation
+    html = get_or_build(
+        card_key(post),
+        lambda: render_to_string(
+            'post_card.html',
+            {'post': post, 'owner_buttons': mark_safe(OWNER_BUTTONS)}
+            ),
+        getattr(settings, 'POSTS_CARD_CACHE_TIMEOUT', 86400),
+        version=(generation, post.card_version)
+        )
+    # only the author sees the buttons, so the URLs take the viewer's name
+    params = {'author_id': post.author_id, 'post_id': post.id}
+    if holes.is_shared(request):
+        buttons = holes.marker('post_buttons', params)
+    else:
+        user = context.get('user')
+        if user is None or not user.is_authenticated:
+            buttons = ''
+        else:
+            buttons = holes.render('post_buttons', params, request, user)
+    return mark_safe(html.replace(OWNER_BUTTONS, buttons))
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, **params):
+    """a region that depends on the viewer
+
+    Rendered in place, or left as a marker filled per request when the
+    page is rendered for the shared cache.
+    """
+    request = context.get('request')
+    if holes.is_shared(request):
+        return holes.marker(name, params)
+    return mark_safe(holes.render(name, params, request, context.get('user')))
+
+
+@register.simple_tag
+def post_thumbnail(post, geometry):
+    """the recorded thumbnail of a post image
+
+    Until the worker or the generate_thumbnails command records it, the
+    original image is shown: rendering it here would resize the image
+    and go through sorl's key-value store within the request.
+    """
+    if not post.image:
+        return None
+    recorded = thumbnails.find(post, geometry)
+    if recorded is not None:
+        return recorded
+    return post.image
+
+
+@register.inclusion_tag('post_picture.html')
+def post_picture(post):
+    """<picture> of the post image with WebP and JPEG srcsets
+
+    Browsers pick the smallest variant that fills the card and prefer
+    WebP. Until the variants are generated it is the single card-sized
+    thumbnail.
+    """
+    sets = thumbnails.srcsets(post) if post.image else []
+    return {
+        'image': post_thumbnail(post, thumbnails.CARD_GEOMETRY),
+        'sources': sets[:-1],
+        'srcset': sets[-1][1] if sets else '',
+        'sizes': getattr(
+            settings, 'POSTS_IMAGE_SIZES', '(max-width: 1200px) 100vw, 1140px'
+            ),
+        }
+
+
+@register.simple_tag
+def page_links(page, paginator):
+    """windowed page numbers, None for a gap"""
+    return page_window(page, paginator)
+
+
+@register.simple_tag(takes_context=True)
+def query_string(context, **kwargs):
+    """the current query string with pagination parameters replaced"""
+    request = context.get('request')
+    params = request.GET.copy() if request is not None else QueryDict(mutable=True)
+    for name in ('page', 'after', 'before'):
+        params.pop(name, None)
+    for name, value in kwargs.items():
+        params[name] = value
+    return '?' + params.urlencode()
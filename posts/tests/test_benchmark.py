@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from posts import urls
+from posts.models import AuthorStats, Comment, Follow, Post, TimelineEntry
+
+REPORT = os.path.join(tempfile.gettempdir(), 'yatube-benchmark-test.json')
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command(
+            'seed', users=20, groups=3, posts=80, comments=60, follows=50,
+            seed=1, stdout=StringIO()
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.path.exists(REPORT):
+            os.remove(REPORT)
+        super().tearDownClass()
+
+    def test_seed(self):
+        """the dataset and the rows derived from it are consistent"""
+        self.assertEqual(Post.objects.count(), 80)
+        self.assertEqual(Comment.objects.count(), 60)
+        self.assertEqual(Follow.objects.count(), 50)
+        post = Post.objects.order_by('-comment_count').first()
+        self.assertEqual(post.comment_count, post.comments.count())
+        stats = AuthorStats.objects.get(user=post.author)
+        self.assertEqual(stats.posts_count, post.author.posts.count())
+        follow = Follow.objects.first()
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=follow.user_id).filter(
+                post__author=follow.author_id
+                ).count(),
+            Post.objects.filter(author=follow.author_id).count()
+            )
+        self.assertGreater(
+            Post.objects.filter(author__username='bench0').count(),
+            Post.objects.filter(author__username='bench19').count(),
+            'Авторы должны распределяться по степенному закону'
+            )
+
+    def test_every_url_is_driven(self):
+        """the report covers posts.urls and compares against itself"""
+        call_command(
+            'benchmark', requests=2, concurrency=1, warmup=0, output=REPORT,
+            stdout=StringIO()
+            )
+        with open(REPORT) as report_file:
+            report = json.load(report_file)
+        self.assertEqual(
+            set(report['results']),
+            {pattern.name for pattern in urls.urlpatterns}
+            )
+        for name, result in report['results'].items():
+            with self.subTest(name=name):
+                self.assertEqual(result['errors'], 0)
+                self.assertIsNotNone(result['p99_ms'])
+                self.assertIsNotNone(result['queries_per_request'])
+        output = StringIO()
+        call_command(
+            'benchmark', requests=2, concurrency=1, warmup=0,
+            only=['index'], compare=REPORT, threshold=10 ** 6, stdout=output
+            )
+        self.assertIn('index', output.getvalue())
+
+    def test_more_queries_is_a_regression(self):
+        """a run issuing more queries than the baseline fails"""
+        with open(REPORT, 'w') as report_file:
+            json.dump({'results': {'index': {
+                'p95_ms': 10 ** 6, 'queries_per_request': 0
+                }}}, report_file)
+        with self.assertRaises(CommandError):
+            call_command(
+                'benchmark', requests=1, concurrency=1, warmup=0,
+                only=['index'], compare=REPORT, stdout=StringIO()
+                )
@@ -0,0 +1,101 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import views
+from posts.management.commands.benchmark import Target
+from posts.models import Post, PostThumbnail
+from yatube.budgets import BudgetExceeded, QueryLog, check_growth
+from yatube.pytest_budgets import SEED, BudgetChecker
+
+PAGES = (
+    'index', 'group_posts', 'profile', 'post', 'follow_index', 'search_post',
+    'new_post', 'post_edit',
+    )
+PUBLIC_PAGES = ('index', 'group_posts', 'profile', 'post', 'search_post')
+LISTS = ('index', 'group_posts', 'profile', 'follow_index', 'search_post')
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command('seed', stdout=StringIO(), **SEED)
+        cls.target = Target(None)
+        cls.guest_client = Client()
+        cls.reader_client = Client()
+        cls.reader_client.force_login(cls.target.user)
+        image_post = Post.objects.exclude(image='').first()
+        cls.image_post = reverse('post', kwargs={
+            'username': image_post.author.username,
+            'post_id': image_post.id
+            })
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.budgets = BudgetChecker(self.reader_client, self.target)
+
+    def test_within_budget(self):
+        """a cold page of a reader stays within the budget of its view"""
+        for name in PAGES:
+            with self.subTest(name=name):
+                self.budgets.check(self.budgets.path(name))
+        with self.subTest(name='post with an image'):
+            self.budgets.check(self.image_post)
+
+    def test_posts_with_images(self):
+        """the pages are measured with the thumbnails the worker records"""
+        self.assertTrue(PostThumbnail.objects.exists())
+        log = self.budgets.check(self.budgets.path('index'))
+        self.assertIn('FROM "posts_postthumbnail"', log.report())
+
+    def test_public_pages_within_budget(self):
+        """so does a page of a guest"""
+        budgets = BudgetChecker(self.guest_client, self.target)
+        for name in PUBLIC_PAGES:
+            with self.subTest(name=name):
+                budgets.check(budgets.path(name))
+
+    def test_no_queries_per_item(self):
+        """a bigger page runs the same queries"""
+        for name in LISTS:
+            with self.subTest(name=name):
+                self.budgets.check_growth(self.budgets.path(name))
+
+    def test_exceeded_budget_shows_the_queries(self):
+        """the failure names the SQL and where it was run from"""
+        with mock.patch.object(views.index, 'query_budget', 1):
+            with self.assertRaises(BudgetExceeded) as error:
+                self.budgets.check(self.budgets.path('index'))
+        message = str(error.exception)
+        self.assertIn('при бюджете 1', message)
+        self.assertIn('FROM "posts_post"', message)
+        self.assertIn('posts/views.py', message)
+        self.assertIn('index.html', message)
+
+    def test_growth_shows_the_repeated_queries(self):
+        """a query per item is reported with the line running it"""
+        logs = []
+        for size in (1, 3):
+            with QueryLog() as log:
+                for post in Post.objects.all()[:size]:
+                    post.author.username
+            logs.append(log)
+        with self.assertRaises(BudgetExceeded) as error:
+            check_growth('posts', *logs)
+        message = str(error.exception)
+        self.assertIn('N+1', message)
+        self.assertIn('FROM "auth_user"', message)
+        self.assertIn('posts/tests/test_budgets.py', message)
@@ -0,0 +1,299 @@
+import hashlib
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import SimpleTestCase, TestCase, Client, override_settings
+from django.urls import reverse
+
+from posts.caching import get_or_build
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class PostCardCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='StasBasov')
+        cls.other = User.objects.create_user(username='IvanIvanov')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text='Исходный текст', author=self.user, group=self.group
+            )
+
+    def render(self, user=None):
+        post = Post.objects.get(id=self.post.id)
+        return Template('{% load post_tags %}{% post_card post %}').render(
+            Context({'post': post, 'user': user or AnonymousUser()})
+            )
+
+    def test_card_is_reused_until_the_post_changes(self):
+        """the card is cached per version and re-rendered after edits"""
+        self.assertIn('Исходный текст', self.render())
+        Post.objects.filter(id=self.post.id).update(text='Тихая правка')
+        self.assertIn('Исходный текст', self.render())
+        self.post.text = 'Новый текст'
+        self.post.save()
+        self.assertIn('Новый текст', self.render())
+
+    def test_comment_and_group_changes(self):
+        """new comments and renamed groups show up on the card"""
+        self.render()
+        Comment.objects.create(post=self.post, author=self.other, text='Ок')
+        self.assertIn('Комментариев: 1', self.render())
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertIn('#Новое название', self.render())
+
+    def test_buttons_are_rendered_live(self):
+        """only the author gets edit/delete buttons on the shared card"""
+        self.assertNotIn('Редактировать', self.render())
+        self.assertIn('Редактировать', self.render(self.user))
+        self.assertNotIn('Редактировать', self.render(self.other))
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='StasBasov')
+        cls.other = User.objects.create_user(username='IvanIvanov')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.other_group = Group.objects.create(title='Другая', slug='other')
+        cls.guest_client = Client()
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text='Исходный текст', author=self.user, group=self.group
+            )
+        self.urls = [
+            reverse('index'),
+            reverse('group_posts', kwargs={'slug': self.group.slug}),
+            reverse('profile', kwargs={'username': self.user.username}),
+            ]
+
+    def assertEverywhere(self, text, present=True):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                if present:
+                    self.assertContains(response, text)
+                else:
+                    self.assertNotContains(response, text)
+
+    def test_pages_stay_cached_without_changes(self):
+        """writes that bypass the models do not reach cached pages"""
+        self.assertEverywhere('Исходный текст')
+        Post.objects.filter(id=self.post.id).update(group=None)
+        self.assertEverywhere('#Группа')
+
+    def test_new_post_and_comment_invalidate(self):
+        """posts and comments show up on every page at once"""
+        self.assertEverywhere('Исходный текст')
+        Post.objects.create(text='Свежий пост', author=self.user, group=self.group)
+        self.assertEverywhere('Свежий пост')
+        Comment.objects.create(post=self.post, author=self.other, text='Ок')
+        self.assertEverywhere('Комментариев: 1')
+
+    def test_moved_post_leaves_old_group(self):
+        """editing the group refreshes the old group page as well"""
+        self.assertEverywhere('Исходный текст')
+        self.post.group = self.other_group
+        self.post.save()
+        self.assertNotContains(self.guest_client.get(self.urls[1]), 'Исходный текст')
+
+    def test_other_scopes_are_kept(self):
+        """a post by another author leaves this profile cached"""
+        profile = self.urls[2]
+        self.guest_client.get(profile)
+        Post.objects.filter(id=self.post.id).update(text='Тихая правка')
+        Post.objects.create(text='Чужой пост', author=self.other)
+        self.assertNotContains(self.guest_client.get(profile), 'Тихая правка')
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='StasBasov')
+        cls.other = User.objects.create_user(username='IvanIvanov')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.guest_client = Client()
+        cls.other_client = Client()
+        cls.other_client.force_login(cls.other)
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text='Исходный текст', author=self.user, group=self.group
+            )
+        self.urls = [
+            reverse('group_posts', kwargs={'slug': self.group.slug}),
+            reverse('profile', kwargs={'username': self.user.username}),
+            reverse(
+                'post',
+                kwargs={'username': self.user.username, 'post_id': self.post.id}
+                ),
+            ]
+
+    def test_unchanged_pages_are_not_modified(self):
+        """a known ETag gets 304 until the content changes"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.guest_client.get(url)['ETag']
+                response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                Comment.objects.create(
+                    post=self.post, author=self.other, text='Ок'
+                    )
+                response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_viewers_get_their_own_etags(self):
+        """a page rendered for one user is never validated for another"""
+        url = self.urls[1]
+        etag = self.guest_client.get(url)['ETag']
+        response = self.other_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+    def test_stale_copy_has_no_validators(self):
+        """the previous copy served during a rebuild gets no ETag"""
+        url = self.urls[2]
+        etag = self.guest_client.get(url)['ETag']
+        Comment.objects.create(
+            post=self.post, author=self.other, text='Новый комментарий'
+            )
+        cache.add(
+            'lock:shared_page:post_page:{}'.format(
+                hashlib.md5(url.encode()).hexdigest()
+                ),
+            'другой запрос', 10
+            )
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Новый комментарий')
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+
+
+class SharedPageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='StasBasov')
+        cls.other = User.objects.create_user(username='IvanIvanov')
+        cls.guest_client = Client()
+        cls.author_client = Client()
+        cls.author_client.force_login(cls.user)
+        cls.other_client = Client()
+        cls.other_client.force_login(cls.other)
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(text='Общий текст', author=self.user)
+        self.url = reverse(
+            'post',
+            kwargs={'username': self.user.username, 'post_id': self.post.id}
+            )
+
+    def shared_keys(self):
+        return [key for key in cache._cache if 'shared_page' in key]
+
+    def test_shared_copy_has_no_user_regions(self):
+        """the cached page keeps markers instead of anyone's regions"""
+        self.author_client.get(self.url)
+        keys = self.shared_keys()
+        self.assertEqual(len(keys), 1, 'Страница должна кешироваться один раз')
+        (content, *_), *_ = cache.get(keys[0].split(':', 2)[2])
+        self.assertIn('<!--hole:', content)
+        self.assertNotIn('csrfmiddlewaretoken', content)
+        self.assertNotIn('Редактировать', content)
+        self.assertNotIn('Профайл', content)
+
+    def test_viewers_share_one_copy(self):
+        """guests and users are served from the same entry"""
+        guest = self.guest_client.get(self.url)
+        self.assertContains(guest, 'Общий текст')
+        self.assertContains(guest, 'Войти')
+        self.assertNotContains(guest, 'Редактировать')
+        Post.objects.filter(id=self.post.id).update(text='Тихая правка')
+
+        author = self.author_client.get(self.url)
+        self.assertContains(author, 'Общий текст')
+        self.assertContains(author, 'Профайл StasBasov')
+        self.assertContains(author, 'Редактировать')
+        self.assertContains(author, 'csrfmiddlewaretoken')
+
+        other = self.other_client.get(self.url)
+        self.assertContains(other, 'Профайл IvanIvanov')
+        self.assertNotContains(other, 'Профайл StasBasov')
+        self.assertNotContains(other, 'Редактировать')
+        self.assertContains(other, 'Подписаться')
+        self.assertEqual(len(self.shared_keys()), 1)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.builds = 0
+
+    def build(self, value='новое', delay=0):
+        def build():
+            self.builds += 1
+            time.sleep(delay)
+            return value
+        return build
+
+    def test_concurrent_misses_build_once(self):
+        """requests missing the same key wait for a single build"""
+        results = []
+
+        def request():
+            results.append(get_or_build('page', self.build(delay=0.3), 60))
+
+        threads = [threading.Thread(target=request) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['новое'] * 5)
+        self.assertEqual(self.builds, 1)
+
+    def test_stale_copy_while_rebuilding(self):
+        """an outdated entry is served while another request rebuilds it"""
+        get_or_build('page', self.build('старое'), 60, version=1)
+        cache.add('lock:page', 'другой запрос', 10)
+        self.assertEqual(
+            get_or_build('page', self.build(), 60, version=2), 'старое'
+            )
+        cache.delete('lock:page')
+        self.assertEqual(
+            get_or_build('page', self.build(), 60, version=2), 'новое'
+            )
+        self.assertEqual(self.builds, 2)
+
+    @override_settings(POSTS_CACHE_LOCK_WAIT=0.1)
+    def test_waiting_is_bounded(self):
+        """a request does not wait forever for a stuck lock holder"""
+        cache.add('lock:page', 'другой запрос', 10)
+        self.assertEqual(get_or_build('page', self.build(), 60), 'новое')
+
+    def test_early_refresh(self):
+        """entries near their expiry are rebuilt before they disappear"""
+        get_or_build('page', self.build('старое'), 60)
+        value, version, expires, delta = cache.get('page')
+        cache.set('page', (value, version, time.time() - 1, delta), 60)
+        self.assertEqual(get_or_build('page', self.build(), 60), 'новое')
+        get_or_build('page', self.build('forever'), None)
+        self.assertEqual(self.builds, 2)
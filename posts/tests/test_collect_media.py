@@ -0,0 +1,94 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from sorl.thumbnail import get_thumbnail
+
+from posts.management.commands.collect_media import walk
+from posts.models import Post
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+    )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, POSTS_THUMBNAIL_WORKERS=0)
+class CollectMediaTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='StasBasov')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text='Пост', author=self.user,
+            image=SimpleUploadedFile('kept.gif', GIF, content_type='image/gif')
+            )
+        self.orphan = default_storage.save(
+            'posts/orphan.gif', ContentFile(GIF + b'\x00')
+            )
+        self.thumbnail = get_thumbnail(self.orphan, '10x10')
+        self.loose = default_storage.save('cache/ab/loose.jpg', ContentFile(b'x'))
+
+    def tearDown(self):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command('collect_media', *args, min_age=0, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_deletes_nothing(self):
+        """the report lists the orphans but the files stay"""
+        report = self.collect('--dry-run')
+        self.assertIn('orphaned images: 1', report)
+        self.assertIn('would reclaim', report)
+        self.assertTrue(default_storage.exists(self.orphan))
+
+    def test_orphans_and_their_thumbnails_are_deleted(self):
+        """only files no post and no thumbnail store entry refers to go"""
+        report = self.collect()
+        self.assertIn('reclaimed: 3 files', report)
+        self.assertFalse(default_storage.exists(self.orphan))
+        self.assertFalse(default_storage.exists(self.thumbnail.name))
+        self.assertFalse(default_storage.exists(self.loose))
+        self.assertTrue(default_storage.exists(self.post.image.name))
+
+    def test_local_directories_are_not_listed(self):
+        """local storage is walked entry by entry, others by listing"""
+        with mock.patch.object(
+                FileSystemStorage, 'listdir', side_effect=AssertionError):
+            self.assertIn('reclaimed: 3 files', self.collect())
+        storage = mock.Mock(spec=['path', 'listdir'])
+        storage.path.side_effect = NotImplementedError
+        storage.listdir.side_effect = lambda directory: {
+            'posts': (['ab'], ['a.gif']), 'posts/ab': ([], ['b.gif']),
+            }[directory]
+        self.assertEqual(
+            list(walk(storage, 'posts')), ['posts/a.gif', 'posts/ab/b.gif']
+            )
+
+    def test_recent_files_are_kept(self):
+        """files younger than --min-age may belong to a post being saved"""
+        out = StringIO()
+        call_command('collect_media', stdout=out)
+        self.assertIn('reclaimed: 0 files', out.getvalue())
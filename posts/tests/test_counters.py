@@ -0,0 +1,85 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from posts.models import AuthorStats, Comment, Follow, Post
+
+User = get_user_model()
+
+
+class CounterTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='StasBasov')
+        cls.author = User.objects.create_user(username='IvanIvanov')
+        cls.guest_client = Client()
+
+    def stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_post_and_comment_counters(self):
+        """creating and deleting posts and comments updates the counters"""
+        post = Post.objects.create(text='Текст', author=self.author)
+        comment = Comment.objects.create(
+            post=post, author=self.user, text='Комментарий'
+            )
+        Comment.objects.create(post=post, author=self.user, text='Ещё')
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 2)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1, 'Счётчик комментариев не уменьшается')
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+
+    def test_follow_counters(self):
+        """following and unfollowing updates both users"""
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.user).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.user).following_count, 0)
+
+    def test_profile_uses_stored_counters(self):
+        """the profile page shows counters without counting the tables"""
+        Post.objects.create(text='Текст', author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        response = self.guest_client.get(
+            reverse('profile', kwargs={'username': self.author.username})
+            )
+        self.assertContains(response, 'Записей: 1')
+        self.assertEqual(response.context['following'], 1)
+        self.assertEqual(response.context['follower'], 0)
+
+    def test_recount_repairs_drift(self):
+        """recount restores counters broken behind the model's back"""
+        post = Post.objects.create(text='Текст', author=self.author)
+        Comment.objects.create(post=post, author=self.user, text='Текст')
+        Post.objects.update(comment_count=7)
+        AuthorStats.objects.filter(user=self.author).update(posts_count=9)
+        AuthorStats.objects.filter(user=self.user).delete()
+        out = StringIO()
+        call_command('recount', stdout=out)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.user).posts_count, 0)
+        self.assertIn('posts with a fixed comment count: 1', out.getvalue())
+
+    def test_drifted_counters_stop_at_zero(self):
+        """decrements of a counter already at 0 keep it at 0"""
+        post = Post.objects.create(text='Текст', author=self.author)
+        comment = Comment.objects.create(
+            post=post, author=self.user, text='Текст'
+            )
+        Post.objects.update(comment_count=0)
+        AuthorStats.objects.filter(user=self.author).update(posts_count=0)
+        comment.delete()
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
@@ -0,0 +1,127 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from posts.feed import should_fan_out, timeline_posts
+from posts.models import Follow, Post, TimelineEntry
+
+User = get_user_model()
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='StasBasov')
+        cls.author = User.objects.create_user(username='IvanIvanov')
+        cls.reader_client = Client()
+        cls.reader_client.force_login(cls.reader)
+
+    def timeline(self):
+        return set(
+            TimelineEntry.objects.filter(
+                user=self.reader
+                ).values_list('post_id', flat=True)
+            )
+
+    def test_new_post_fans_out(self):
+        """a new post lands in the timeline of every follower"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='Текст автора', author=self.author)
+        self.assertEqual(
+            self.timeline(), {post.id},
+            'Новый пост не попадает в ленту подписчика'
+            )
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """following copies old posts, unfollowing removes them"""
+        posts = {
+            Post.objects.create(text=f'Пост {i}', author=self.author).id
+            for i in range(3)
+            }
+        self.reader_client.get(
+            reverse('profile_follow', kwargs={'username': self.author})
+            )
+        self.assertEqual(
+            self.timeline(), posts,
+            'Старые посты автора не добавляются в ленту после подписки'
+            )
+        self.reader_client.get(
+            reverse('profile_unfollow', kwargs={'username': self.author})
+            )
+        self.assertEqual(
+            self.timeline(), set(),
+            'Посты автора остаются в ленте после отписки'
+            )
+
+    def test_feed_reads_timeline(self):
+        """the follow feed shows exactly the timeline rows"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(text='Текст автора', author=self.author)
+        Post.objects.create(text='Чужой текст', author=self.reader)
+        response = self.reader_client.get(reverse('follow_index'))
+        self.assertContains(response, 'Текст автора')
+        self.assertNotContains(response, 'Чужой текст')
+
+    def test_feed_ordered_by_timeline(self):
+        """entries copy the post date and the feed is read in its order"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [
+            Post.objects.create(text=f'Пост {i}', author=self.author)
+            for i in range(3)
+            ]
+        entries = TimelineEntry.objects.filter(user=self.reader)
+        for entry in entries.select_related('post'):
+            self.assertEqual(entry.pub_date, entry.post.pub_date)
+        feed = timeline_posts(self.reader)
+        self.assertIn('"posts_timelineentry"."pub_date" DESC', str(feed.query))
+        self.assertEqual(list(feed), posts[::-1])
+
+
+@override_settings(POSTS_FANOUT_FOLLOWER_LIMIT=2)
+class HybridFeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.star = User.objects.create_user(username='Star')
+        cls.readers = [
+            User.objects.create_user(username=f'Reader{i}') for i in range(2)
+            ]
+        for reader in cls.readers:
+            Follow.objects.create(user=reader, author=cls.star)
+
+    def test_popular_author_is_pulled(self):
+        """posts of authors over the threshold are merged at read time"""
+        post = Post.objects.create(text='Текст звезды', author=self.star)
+        self.assertFalse(Post.objects.get(id=post.id).fanned_out)
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=post).exists(),
+            'Пост популярного автора рассылается по лентам'
+            )
+        for reader in self.readers:
+            self.assertIn(post, timeline_posts(reader))
+        Follow.objects.filter(user=self.readers[0]).delete()
+        self.assertNotIn(post, timeline_posts(self.readers[0]))
+
+    def test_feed_report(self):
+        """the report prints amplification for the configured threshold"""
+        Post.objects.create(text='Текст звезды', author=self.star)
+        out = StringIO()
+        call_command('feed_report', stdout=out)
+        self.assertIn('follower threshold: 2', out.getvalue())
+        self.assertIn('hybrid: 0.00', out.getvalue())
+        self.assertIn('pure push: 2.00', out.getvalue())
+
+    @override_settings(POSTS_FANOUT_FOLLOWER_LIMIT=0)
+    def test_zero_threshold_pulls_everyone(self):
+        """a limit of 0 pulls the posts of every author"""
+        self.assertFalse(should_fan_out(self.readers[0].id))
+
+    def test_feed_report_zero_threshold(self):
+        """--threshold 0 is simulated, not taken for the default"""
+        out = StringIO()
+        call_command('feed_report', threshold=0, stdout=out)
+        self.assertIn('follower threshold: 0', out.getvalue())
@@ -0,0 +1,80 @@
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from posts.forms import PostForm
+
+
+def make_image(size, format_='JPEG', **options):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, format=format_, **options)
+    return SimpleUploadedFile(
+        'photo.' + format_.lower(), buffer.getvalue(),
+        content_type=Image.MIME[format_]
+        )
+
+
+def exif_bytes():
+    exif = Image.Exif()
+    exif[0x010f] = 'Camera'
+    return exif.tobytes()
+
+
+@override_settings(
+    POSTS_IMAGE_MAX_SIDE=100, POSTS_IMAGE_MAX_PIXELS=1_000_000
+    )
+class ImageIngestTests(TestCase):
+    def clean(self, upload):
+        form = PostForm({'text': 'Текст'}, {'image': upload})
+        return form, form.is_valid()
+
+    def test_oversized_image_is_downscaled_and_stripped(self):
+        """large originals are shrunk to the limit without EXIF"""
+        form, valid = self.clean(make_image((400, 200), exif=exif_bytes()))
+        self.assertTrue(valid, form.errors)
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.size, (100, 50))
+            self.assertEqual(image.format, 'JPEG')
+            self.assertNotIn('exif', image.info)
+
+    def test_metadata_is_stripped_from_small_images(self):
+        """small images are re-encoded only to drop their metadata"""
+        form, valid = self.clean(make_image((50, 50), exif=exif_bytes()))
+        self.assertTrue(valid, form.errors)
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.size, (50, 50))
+            self.assertFalse(image.getexif())
+
+    def test_clean_image_is_kept(self):
+        """an image within the limits is stored as uploaded"""
+        upload = make_image((50, 50), 'PNG')
+        form, valid = self.clean(upload)
+        self.assertTrue(valid, form.errors)
+        self.assertIs(form.cleaned_data['image'], upload)
+
+    def test_limits(self):
+        """too many pixels or bytes are rejected before decoding"""
+        form, valid = self.clean(make_image((1001, 1000), 'PNG'))
+        self.assertFalse(valid)
+        self.assertIn('Картинка слишком большая', form.errors['image'][0])
+        with self.settings(POSTS_IMAGE_MAX_UPLOAD_SIZE=100):
+            form, valid = self.clean(make_image((50, 50)))
+        self.assertFalse(valid)
+        self.assertIn('Файл слишком большой', form.errors['image'][0])
+
+    def test_decode_budget(self):
+        """JPEGs within the pixel limit are decoded small enough to be
+        downscaled, other formats over the budget count as too large
+        """
+        with self.settings(POSTS_IMAGE_DECODE_BUDGET=190 * 190 * 3 - 1):
+            form, valid = self.clean(make_image((190, 190)))
+            self.assertTrue(valid, form.errors)
+            with Image.open(form.cleaned_data['image']) as image:
+                self.assertEqual(image.size, (95, 95))
+            form, valid = self.clean(make_image((190, 190), 'PNG'))
+        self.assertFalse(valid)
+        self.assertEqual(
+            form.errors.as_data()['image'][0].code, 'too_many_pixels'
+            )
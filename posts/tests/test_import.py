@@ -0,0 +1,212 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.counters import author_stats
+from posts.management.commands import import_posts
+from posts.models import Follow, Group, Post, StoredImage, TimelineEntry
+from posts.search import search_posts
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+    )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ImportPostsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.guest_client = Client()
+        cls.author = User.objects.create_user(username='leo')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Книги', slug='books')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def source(self, records, name='posts.jsonl'):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as source:
+            for record in records:
+                source.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return path
+
+    def run_import(self, path, **options):
+        stdout, stderr = StringIO(), StringIO()
+        call_command(
+            'import_posts', path, stdout=stdout, stderr=stderr, **options
+            )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_jsonl(self):
+        """posts keep their dates and get counted, fanned out and indexed"""
+        path = self.source([
+            {'text': 'Война и мир', 'author': 'leo', 'group': 'books',
+             'pub_date': '1869-01-01T12:00:00'},
+            {'text': 'Анна Каренина', 'author': 'leo'},
+            ])
+        index = self.guest_client.get(reverse('index'))
+        output, _ = self.run_import(path)
+        self.assertIn('imported: 2, skipped: 0', output)
+        post = Post.objects.get(text='Война и мир')
+        self.assertEqual(post.group, self.group)
+        self.assertEqual(post.pub_date.year, 1869)
+        self.assertEqual(post.updated, post.pub_date)
+        self.assertEqual(author_stats(self.author).posts_count, 2)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 2
+            )
+        self.assertEqual(search_posts('война'), [post.id])
+        response = self.guest_client.get(reverse('index'))
+        self.assertNotEqual(response.content, index.content)
+        self.assertContains(response, 'Анна Каренина')
+
+    def test_fields_of_other_types(self):
+        """records with non-string fields are skipped, not fatal"""
+        path = self.source([
+            {'text': 'Война и мир', 'author': 'leo', 'pub_date': 1869},
+            {'text': 5, 'author': 'leo'},
+            {'text': 'Анна Каренина', 'author': 'leo', 'group': None},
+            ])
+        output, errors = self.run_import(path)
+        self.assertIn('imported: 1, skipped: 2', output)
+        self.assertIn('record 1: не строка: pub_date', errors)
+        self.assertIn('record 2: не строка: text', errors)
+
+    def test_csv(self):
+        """CSV columns are the same fields"""
+        path = os.path.join(self.directory, 'posts.csv')
+        with open(path, 'w', encoding='utf-8') as source:
+            source.write('text,author,group\n"Детство, отрочество",leo,\n')
+        self.run_import(path)
+        post = Post.objects.get(text='Детство, отрочество')
+        self.assertIsNone(post.group)
+
+    def test_unknown_authors_and_groups(self):
+        """records of unknown authors or groups are skipped, or create them"""
+        path = self.source([
+            {'text': 'Пост', 'author': 'anna'},
+            {'text': 'Пост', 'author': 'leo', 'group': 'poems'},
+            {'text': '', 'author': 'leo'},
+            ])
+        output, errors = self.run_import(path)
+        self.assertIn('imported: 0, skipped: 3', output)
+        self.assertIn('record 1: нет автора anna', errors)
+        output, _ = self.run_import(path, restart=True, create_missing=True)
+        self.assertIn('imported: 2, skipped: 1', output)
+        anna = User.objects.get(username='anna')
+        self.assertFalse(anna.has_usable_password())
+        self.assertTrue(Group.objects.filter(slug='poems').exists())
+
+    def test_resume_after_crash(self):
+        """a rerun continues after the last committed batch"""
+        path = self.source(
+            {'text': f'Пост {n}', 'author': 'leo'} for n in range(5)
+            )
+        original = import_posts.Command.write
+        calls = []
+
+        def crashing(command, posts, after_id):
+            calls.append(len(posts))
+            if len(calls) == 2:
+                raise RuntimeError('сбой')
+            return original(command, posts, after_id)
+
+        with mock.patch.object(import_posts.Command, 'write', crashing):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path, batch_size=2)
+        self.assertEqual(Post.objects.count(), 2)
+        output, _ = self.run_import(path, batch_size=2)
+        self.assertIn('resuming after record 2', output)
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)),
+            [f'Пост {n}' for n in range(5)]
+            )
+        output, _ = self.run_import(path, batch_size=2)
+        self.assertIn('imported: 0', output)
+        self.assertEqual(Post.objects.count(), 5)
+
+    def test_committed_batch_is_not_repeated(self):
+        """a crash after the commit, before the checkpoint, is detected"""
+        path = self.source(
+            {'text': f'Пост {n}', 'author': 'leo'} for n in range(3)
+            )
+        self.run_import(path, batch_size=2)
+        # as if the run died right after committing the first batch
+        Post.objects.filter(text='Пост 2').delete()
+        with open(path + '.checkpoint') as checkpoint:
+            state = json.load(checkpoint)
+        state.update(done=0, pending=2, after_id=0)
+        with open(path + '.checkpoint', 'w') as checkpoint:
+            json.dump(state, checkpoint)
+        output, _ = self.run_import(path, batch_size=2)
+        self.assertIn('resuming after record 2', output)
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)),
+            [f'Пост {n}' for n in range(3)]
+            )
+
+    def test_images_in_worker_processes(self):
+        """images are copied by content and counted once per post"""
+        images = os.path.join(self.directory, 'images')
+        os.mkdir(images)
+        for name in ('a.gif', 'b.gif'):
+            with open(os.path.join(images, name), 'wb') as image:
+                image.write(GIF)
+        path = self.source([
+            {'text': 'Первый', 'author': 'leo', 'image': 'a.gif'},
+            {'text': 'Второй', 'author': 'leo', 'image': 'b.gif'},
+            {'text': 'Третий', 'author': 'leo', 'image': '../posts.jsonl'},
+            ])
+        output, errors = self.run_import(path, images=images, workers=2)
+        self.assertIn('imported: 2, skipped: 1', output)
+        self.assertIn('вне каталога картинок', errors)
+        first, second = Post.objects.order_by('id')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.storage.exists(first.image.name))
+        stored = StoredImage.objects.get(name=first.image.name)
+        self.assertEqual(stored.refs, 2)
+
+    def test_images_of_records_not_written(self):
+        """skipped records and failed batches give their images back"""
+        images = os.path.join(self.directory, 'images')
+        os.mkdir(images)
+        with open(os.path.join(images, 'a.gif'), 'wb') as image:
+            image.write(GIF)
+        path = self.source([
+            {'text': 'Пост', 'author': 'leo', 'image': 'a.gif'},
+            {'text': 'Пост', 'author': 'anna', 'image': 'a.gif'},
+            ])
+        with mock.patch.object(
+                import_posts.Command, 'write', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path, images=images, workers=1)
+        self.assertFalse(StoredImage.objects.filter(refs__gt=0).exists())
+        self.run_import(path, images=images, workers=1, restart=True)
+        post = Post.objects.get()
+        self.assertEqual(
+            StoredImage.objects.get(name=post.image.name).refs, 1
+            )
@@ -0,0 +1,121 @@
+import os
+import re
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from posts import images
+from posts.models import Post, StoredImage
+from posts.storage import SHARDED_IMAGE_REGEX, ShardedStorage
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+    )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, POSTS_THUMBNAIL_WORKERS=0)
+class ShardedMediaTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='StasBasov')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_uploads_are_sharded(self):
+        """new images land in posts/ab/cd/<sha256>.<ext>"""
+        post = Post.objects.create(
+            text='Пост', author=self.user,
+            image=SimpleUploadedFile('Small.GIF', GIF, content_type='image/gif')
+            )
+        self.assertRegex(
+            post.image.name, SHARDED_IMAGE_REGEX + r'[0-9a-f]{64}\.gif$'
+            )
+
+    def upload(self, text):
+        return Post.objects.create(
+            text=text, author=self.user,
+            image=SimpleUploadedFile('meme.gif', GIF, content_type='image/gif')
+            )
+
+    @override_settings(POSTS_IMAGE_COLLECT_GRACE=0)
+    def test_identical_uploads_share_a_file(self):
+        """the file is deleted with the last post using it"""
+        first = self.upload('Первый')
+        second = self.upload('Второй')
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(StoredImage.objects.get(name=name).refs, 2)
+        first.delete()
+        images.collect(name)
+        self.assertTrue(default_storage.exists(name))
+        second.delete()
+        # on_commit callbacks do not run inside TestCase
+        images.collect(name)
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(StoredImage.objects.filter(name=name).exists())
+
+    def test_file_saved_again_is_not_collected(self):
+        """a file handed out again before its post counts it stays"""
+        post = self.upload('Первый')
+        name = post.image.name
+        os.utime(os.path.join(MEDIA_ROOT, name), (0, 0))
+        post.delete()
+        # another upload of the same image, its post not saved yet
+        saved = default_storage.save(
+            'posts/meme.gif',
+            SimpleUploadedFile('meme.gif', GIF, content_type='image/gif')
+            )
+        self.assertEqual(saved, name)
+        images.collect(name)
+        self.assertTrue(default_storage.exists(name))
+
+    def test_concurrent_saves_share_a_file(self):
+        """a file written between the check and the save is reused"""
+        name = self.upload('Первый').image.name
+        upload = SimpleUploadedFile('meme.gif', GIF, content_type='image/gif')
+        exists = ShardedStorage.exists
+        checks = iter([False])
+        with mock.patch.object(
+                ShardedStorage, 'exists', autospec=True,
+                side_effect=lambda storage, path: next(
+                    checks, exists(storage, path)
+                    )):
+            saved = default_storage.save('posts/meme.gif', upload)
+        self.assertEqual(saved, name)
+        self.assertEqual(os.listdir(os.path.dirname(
+            os.path.join(MEDIA_ROOT, name)
+            )), [os.path.basename(name)])
+
+    def test_command_moves_old_images(self):
+        """old flat paths are moved and the command can run again"""
+        old = 'posts/old.gif'
+        os.makedirs(os.path.join(MEDIA_ROOT, 'posts'), exist_ok=True)
+        with open(os.path.join(MEDIA_ROOT, old), 'wb') as image:
+            image.write(GIF)
+        post = Post.objects.create(text='Старый пост', author=self.user)
+        Post.objects.filter(id=post.id).update(image=old)
+        out = StringIO()
+        call_command('shard_images', batch_size=1, stdout=out)
+        post.refresh_from_db()
+        self.assertTrue(re.match(SHARDED_IMAGE_REGEX, post.image.name))
+        self.assertTrue(default_storage.exists(post.image.name))
+        self.assertFalse(default_storage.exists(old))
+        out = StringIO()
+        call_command('shard_images', stdout=out)
+        self.assertIn('images moved: 0', out.getvalue())
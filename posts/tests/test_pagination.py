@@ -0,0 +1,122 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Post
+from posts.pagination import (
+    CursorPaginator, decode_cursor, encode_cursor, page_window
+    )
+
+User = get_user_model()
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='StasBasov')
+        cls.guest_client = Client()
+        for i in range(25):
+            Post.objects.create(text=f'Пост номер {i}', author=cls.user)
+        cls.ordered = list(Post.objects.order_by('-pub_date', '-id'))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_round_trip(self):
+        """a token decodes back to the (pub_date, id) of its post"""
+        post = self.ordered[0]
+        self.assertEqual(
+            decode_cursor(encode_cursor(post)),
+            (post.pub_date, post.id),
+            'Курсор не восстанавливает позицию поста'
+            )
+        self.assertIsNone(decode_cursor('не-курсор'))
+
+    def test_walk_forward_and_back(self):
+        """after/before tokens visit every post exactly once"""
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        page = paginator.get_page()
+        seen = list(page)
+        pages = [page]
+        while page.has_next():
+            page = paginator.get_page(after=page.next_cursor)
+            seen.extend(page)
+            pages.append(page)
+        self.assertEqual(seen, self.ordered, 'Курсоры теряют или дублируют посты')
+        self.assertFalse(pages[0].has_previous())
+        back = paginator.get_page(before=pages[-1].previous_cursor)
+        self.assertEqual(list(back), list(pages[-2]))
+
+    def test_page_links_still_work(self):
+        """?page=N keeps using the numbered paginator"""
+        response = self.guest_client.get(reverse('index') + '?page=2')
+        self.assertIsInstance(response.context['paginator'], Paginator)
+        self.assertEqual(response.context['page'].number, 2)
+
+    @override_settings(POSTS_PAGINATION='cursor')
+    def test_cursor_mode_view(self):
+        """cursor mode renders next-only links with an opaque token"""
+        response = self.guest_client.get(
+            reverse('profile', kwargs={'username': self.user.username})
+            )
+        page = response.context['page']
+        self.assertTrue(page.is_cursor)
+        self.assertContains(response, f'?after={page.next_cursor}')
+        self.assertNotContains(response, '?page=')
+        response = self.guest_client.get(
+            reverse('profile', kwargs={'username': self.user.username}),
+            {'after': page.next_cursor}
+            )
+        self.assertEqual(list(response.context['page']), self.ordered[5:10])
+
+
+class WindowedPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='StasBasov')
+        cls.guest_client = Client()
+        for i in range(60):
+            Post.objects.create(text=f'Кошка номер {i}', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_window(self):
+        """first, last and neighbouring pages with gaps between them"""
+        paginator = Paginator(range(1000), 10)
+        self.assertEqual(
+            page_window(paginator.page(50), paginator, 2),
+            [1, None, 48, 49, 50, 51, 52, None, 100]
+            )
+        self.assertEqual(
+            page_window(paginator.page(2), paginator, 2),
+            [1, 2, 3, 4, None, 100]
+            )
+        self.assertEqual(page_window(paginator.page(1), Paginator([1], 10)), [1])
+
+    def test_index_renders_window_from_cached_count(self):
+        """the index links a window of pages and does not recount"""
+        response = self.guest_client.get(reverse('index'))
+        self.assertContains(response, '?page=6')
+        self.assertContains(response, '&hellip;')
+        self.assertNotContains(response, '?page=4"')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(reverse('index'), {'page': 4})
+        self.assertFalse(
+            [q for q in queries.captured_queries if 'COUNT(' in q['sql']],
+            'Число постов пересчитывается на каждой странице'
+            )
+        self.assertEqual(response.context['paginator'].count, 60)
+
+    def test_search_links_keep_query(self):
+        """page links of the search results keep the search query"""
+        response = self.guest_client.get(
+            reverse('search_post'), {'search_query': 'кошка'}
+            )
+        self.assertContains(response, '?search_query=%D0%BA%D0%BE%D1%88%D0%BA%D0%B0&amp;page=2')
@@ -0,0 +1,106 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import thumbnails
+from posts.models import FeedRow, Follow, Group, Post, PostThumbnail
+from yatube.budgets import QueryLog, budget_of, check_budget
+
+User = get_user_model()
+
+
+class FeedQuerySetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.guest_client = Client()
+        cls.user = User.objects.create_user(username='StasBasov')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.reader_client = Client()
+        cls.reader_client.force_login(cls.reader)
+        Follow.objects.create(user=cls.reader, author=cls.user)
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {n}', author=cls.user,
+                group=cls.group if n % 2 else None
+                )
+            for n in range(3)
+            ]
+        Post.objects.filter(
+            id__in=[cls.posts[0].id, cls.posts[1].id]
+            ).update(image='posts/a.gif')
+        PostThumbnail.objects.create(
+            post=cls.posts[0], geometry='960x339', format='JPEG',
+            source='posts/a.gif', name='cache/a.jpg', width=960, height=339
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def read(self, posts):
+        return [
+            (post.id, str(post.author), post.group and post.group.slug,
+             post.comment_count, post.card_version,
+             [t.name for t in thumbnails.current(post)] if post.image else [])
+            for post in posts
+            ]
+
+    def test_constant_queries(self):
+        """a page of cards is the posts and the thumbnails of images"""
+        with self.assertNumQueries(2):
+            read = self.read(Post.objects.feed())
+        self.assertEqual(read, self.read(Post.objects.all()))
+
+    def test_unused_columns_deferred(self):
+        """only the columns the card shows are loaded"""
+        post = Post.objects.feed().get(id=self.posts[1].id)
+        self.assertEqual(post.get_deferred_fields(), {'fanned_out'})
+        self.assertIn('password', post.author.get_deferred_fields())
+        self.assertIn('description', post.group.get_deferred_fields())
+
+    def test_list_pages_within_budget(self):
+        """the thumbnail query fits the budgets of the list pages"""
+        for url in (reverse('index'),
+                    reverse('group_posts', kwargs={'slug': 'group'}),
+                    reverse('profile', kwargs={'username': 'StasBasov'}),
+                    reverse('follow_index'),
+                    reverse('search_post') + '?search_query=Пост'):
+            with self.subTest(url=url):
+                cache.clear()
+                with QueryLog() as log:
+                    response = self.reader_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(
+                    'FROM "posts_postthumbnail"', log.report(),
+                    'Страница показывает картинку поста'
+                    )
+                check_budget(
+                    url, log, budget_of(response.resolver_match.func)
+                    )
+
+    def test_rows(self):
+        """rows() reads like the model instances, without them"""
+        with self.assertNumQueries(2):
+            rows = list(Post.objects.feed().rows())
+        self.assertIsInstance(rows[0], FeedRow)
+        self.assertFalse(hasattr(rows[0], '__dict__'), 'Строка без слотов')
+        self.assertEqual(self.read(rows), self.read(Post.objects.all()))
+        with_image = next(row for row in rows if row.id == self.posts[0].id)
+        self.assertEqual(
+            with_image.image.url, default_storage.url('posts/a.gif')
+            )
+
+    @override_settings(POSTS_FEED_ROWS=True)
+    def test_list_pages_with_rows(self):
+        """list pages render the same cards from rows"""
+        for url in (reverse('index'),
+                    reverse('group_posts', kwargs={'slug': 'group'}),
+                    reverse('profile', kwargs={'username': 'StasBasov'})):
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertIsInstance(response.context['page'][0], FeedRow)
+                self.assertContains(response, 'Пост 1')
+                self.assertContains(response, '#Группа')
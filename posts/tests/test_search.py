@@ -0,0 +1,158 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from posts import fts
+from posts.models import Post, SearchPosting
+from posts.search import normalize_query, search_posts, stem, tokenize
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='StasBasov')
+        cls.guest_client = Client()
+        cls.short = Post.objects.create(
+            text='Красивые кошки на фотографиях из отпуска', author=cls.user
+            )
+        cls.long = Post.objects.create(
+            text='Кошка спала на окне, а потом кошка ушла гулять по крышам',
+            author=cls.user
+            )
+        cls.other = Post.objects.create(
+            text='Собаки лаяли всю ночь', author=cls.user
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_russian_stemming(self):
+        """word forms share a stem, stop words are dropped"""
+        self.assertEqual(stem('кошками'), stem('кошка'))
+        self.assertEqual(stem('красивая'), stem('красивые'))
+        self.assertEqual(tokenize('Ёжик и я'), ['ежик'])
+        self.assertEqual(normalize_query('КОШКИ кошка'), stem('кошки'))
+
+    def test_ranked_results(self):
+        """any word form finds the posts, the denser match ranks first"""
+        found = search_posts('кошками')
+        self.assertEqual(set(found), {self.short.id, self.long.id})
+        self.assertNotIn(self.other.id, found)
+        self.assertEqual(search_posts('кошка спит'), [self.long.id, self.short.id])
+
+    def test_index_follows_edits_and_deletes(self):
+        """the index is rewritten on save and dropped on delete"""
+        self.other.text = 'Собаки и кошки'
+        self.other.save()
+        self.assertIn(self.other.id, search_posts('кошка'))
+        self.other.delete()
+        self.assertFalse(
+            SearchPosting.objects.filter(document_id=self.other.id).exists()
+            )
+
+    def test_one_index_lookup_and_cache(self):
+        """a search runs one index query, a repeated one none"""
+        search_posts('кошка')
+        with self.assertNumQueries(1):
+            search_posts('собака')
+        with self.assertNumQueries(0):
+            search_posts('Собаки')
+
+    def test_search_view(self):
+        """the view renders matches and the empty messages"""
+        response = self.guest_client.get(
+            reverse('search_post'), {'search_query': 'кошки'}
+            )
+        self.assertContains(response, 'Красивые кошки')
+        self.assertNotContains(response, 'Собаки лаяли')
+        response = self.guest_client.get(
+            reverse('search_post'), {'search_query': 'жираф'}
+            )
+        self.assertContains(response, 'По Вашему запросу ничего не найдено.')
+        response = self.guest_client.get(
+            reverse('search_post'), {'search_query': ''}
+            )
+        self.assertContains(response, 'Пустой запрос')
+
+
+@override_settings(POSTS_SEARCH_BACKEND='posts.search.SQLiteFTSBackend')
+class FTSSearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='StasBasov')
+        cls.cats = Post.objects.create(
+            text='Кошки спали на подоконнике', author=cls.user
+            )
+        cls.dogs = Post.objects.create(
+            text='Собаки лаяли всю ночь', author=cls.user
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_tables_installed(self):
+        """the migration creates the FTS tables on SQLite"""
+        self.assertEqual(
+            fts.available_tables(connection),
+            {fts.WORD_TABLE, fts.TRIGRAM_TABLE}
+            )
+
+    def test_tables_looked_up_once(self):
+        """a search that misses the cache runs only its MATCH query"""
+        search_posts('кошками')
+        cache.clear()
+        with self.assertNumQueries(1):
+            search_posts('собаки')
+        fts.install(connection)
+        cache.clear()
+        with self.assertNumQueries(2):
+            search_posts('собаки')
+
+    def test_word_forms_and_triggers(self):
+        """stems match other word forms, triggers follow edits"""
+        self.assertEqual(search_posts('кошками'), [self.cats.id])
+        self.dogs.text = 'Собака и кошка'
+        self.dogs.save()
+        cache.clear()
+        self.assertEqual(set(search_posts('кошка')), {self.cats.id, self.dogs.id})
+        self.dogs.delete()
+        cache.clear()
+        self.assertEqual(search_posts('кошка'), [self.cats.id])
+
+    def test_trigram_fallback(self):
+        """parts of words are found through the trigram table"""
+        self.assertEqual(search_posts('оконн'), [self.cats.id])
+        with override_settings(POSTS_SEARCH_FTS_MODE='trigram'):
+            self.assertEqual(search_posts('лаял'), [self.dogs.id])
+
+    def test_mode_in_cache_key(self):
+        """results of one mode are not served in the other"""
+        self.assertEqual(search_posts('кошками'), [self.cats.id])
+        with override_settings(POSTS_SEARCH_FTS_MODE='trigram'):
+            self.assertEqual(search_posts('кошками'), [])
+
+    def test_icontains_fallback(self):
+        """databases without FTS tables are scanned with icontains"""
+        with mock.patch.object(fts, 'available_tables', return_value=set()):
+            self.assertEqual(search_posts('ночь'), [self.dogs.id])
+            self.assertEqual(
+                search_posts('лаяли  всю ночь'), [self.dogs.id],
+                'Запрос без FTS ищется как есть, без стоп-слов и сортировки'
+                )
+
+    @override_settings(POSTS_SEARCH_BACKEND='posts.search.IContainsBackend')
+    def test_icontains_backend(self):
+        """the old substring search stays available as a backend"""
+        self.assertEqual(search_posts('подокон'), [self.cats.id])
+        self.assertEqual(
+            search_posts('Кошки'), [self.cats.id],
+            'SQLite не сравнивает кириллицу без учёта регистра'
+            )
@@ -0,0 +1,125 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.template import Context, Template
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import thumbnails
+from posts.models import Post, PostThumbnail
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+    )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, POSTS_THUMBNAIL_WORKERS=0)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='StasBasov')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text='Пост с картинкой', author=self.user,
+            image=SimpleUploadedFile('small.gif', GIF, content_type='image/gif')
+            )
+
+    def render(self):
+        post = Post.objects.get(id=self.post.id)
+        return Template('{% load post_tags %}{% post_card post %}').render(
+            Context({'post': post})
+            )
+
+    def test_generate_records_every_geometry(self):
+        """thumbnails of the current image are recorded and rendered"""
+        made = thumbnails.generate(self.post.id)
+        self.assertEqual(len(made), len(thumbnails.variants(source_width=1)))
+        record = PostThumbnail.objects.get(
+            post=self.post, geometry='960x339', format='JPEG'
+            )
+        self.assertEqual(record.source, self.post.image.name)
+        self.assertEqual((record.width, record.height), (960, 339))
+        self.assertIn(record.url, self.render())
+
+    def test_original_until_generated(self):
+        """without records the card shows the image without resizing it"""
+        PostThumbnail.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            html = self.render()
+        self.assertFalse(
+            [query for query in queries
+             if 'thumbnail_kvstore' in query['sql']],
+            'Шаблон не обращается к хранилищу sorl'
+            )
+        self.assertIn('src="{}"'.format(self.post.image.url), html)
+        self.assertNotIn('srcset', html)
+
+    def test_picture_has_webp_and_jpeg_srcsets(self):
+        """the card offers WebP and JPEG variants by width"""
+        thumbnails.generate(self.post.id)
+        html = self.render()
+        self.assertIn('<picture>', html)
+        self.assertIn('type="image/webp"', html)
+        webp = PostThumbnail.objects.get(post=self.post, format='WEBP')
+        self.assertIn('{} 480w'.format(webp.url), html)
+        self.assertTrue(webp.name.endswith('.webp'))
+
+    def test_post_page_reads_thumbnails_once(self):
+        """the post page looks the thumbnails up in one query"""
+        thumbnails.generate(self.post.id)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = Client().get(reverse('post', kwargs={
+                'username': self.user.username, 'post_id': self.post.id
+                }))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertEqual(
+            len([query for query in queries
+                 if 'FROM "posts_postthumbnail"' in query['sql']]), 1
+            )
+
+    def test_variants_skip_upscaling(self):
+        """widths above the source are not generated, but the smallest is"""
+        geometries = {geometry for geometry, _, _ in thumbnails.variants(1000)}
+        self.assertIn('480x170', geometries)
+        self.assertNotIn('1440x508', geometries)
+        geometries = {geometry for geometry, _, _ in thumbnails.variants(2000)}
+        self.assertIn('1440x508', geometries)
+
+    def test_new_image_replaces_records(self):
+        """records of a replaced image are dropped"""
+        thumbnails.generate(self.post.id)
+        Post.objects.filter(id=self.post.id).update(image='')
+        self.assertEqual(thumbnails.generate(self.post.id), [])
+        self.assertFalse(PostThumbnail.objects.filter(post=self.post).exists())
+
+    def test_backfill_command(self):
+        """the command generates only the missing thumbnails"""
+        PostThumbnail.objects.all().delete()
+        out = StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertIn('posts: 1', out.getvalue())
+        self.assertTrue(PostThumbnail.objects.filter(post=self.post).exists())
+        out = StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertIn('posts: 0', out.getvalue())
@@ -200,18 +200,26 @@ class StaticViewTests(TestCase):
 
     def test_cache(self):
         """checks the cache operation"""
+        cache.clear()
+        self.authorized_client.get(reverse('index'))
+        Post.objects.filter(id=self.new_post.id).update(text='Тихая правка')
+        self.assertNotContains(
+                self.authorized_client.get(reverse('index')),
+                'Тихая правка',
+                msg_prefix='Кэш не работает'
+                )
         self.authorized_client.post(
             reverse('new_post'), {'text': 'Это тест кэша'}, follow=True
             )
-        self.assertNotContains(
+        self.assertContains(
                 self.authorized_client.get(reverse('index')),
                 'Это тест кэша',
-                msg_prefix='Кэш не работает'
+                msg_prefix='Кэш не сбрасывается после нового поста'
                 )
         cache.clear()
         self.assertContains(
                 self.authorized_client.get(reverse('index')),
-                'Это текст публикации',
+                'Тихая правка',
                 msg_prefix='Кэш работает не правильно'
                 )
 
@@ -0,0 +1,202 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from sorl.thumbnail import get_thumbnail
+
+from .models import Post, PostThumbnail
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+CARD_GEOMETRY = '960x339'
+MIME_TYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+
+
+def geometries():
+    """thumbnail geometries used by the templates, with their options"""
+    return getattr(settings, 'POSTS_THUMBNAIL_GEOMETRIES', {
+        '960x339': {'crop': 'center', 'upscale': True},
+        })
+
+
+def workers():
+    """threads generating thumbnails, 0 to generate them inline"""
+    return getattr(settings, 'POSTS_THUMBNAIL_WORKERS', 2)
+
+
+def responsive_widths():
+    return getattr(settings, 'POSTS_IMAGE_WIDTHS', (480, 960, 1440))
+
+
+def responsive_formats():
+    """formats of the srcset variants, the preferred one first"""
+    return getattr(settings, 'POSTS_IMAGE_FORMATS', ('WEBP', 'JPEG'))
+
+
+def variants(source_width=None):
+    """(geometry, format, options) of every image generated for a post
+
+    Besides the configured geometries, the card geometry is scaled to
+    every responsive width in every responsive format. Widths above the
+    source width are skipped, except the smallest one, since upscaled
+    variants only cost bytes.
+    """
+    made = {}
+    for geometry, options in geometries().items():
+        format_ = options.get('format', 'JPEG')
+        made[geometry, format_] = dict(options, format=format_)
+    card_width, card_height = map(int, CARD_GEOMETRY.split('x'))
+    options = geometries().get(CARD_GEOMETRY, {})
+    widths = sorted(responsive_widths())
+    for width in widths:
+        if source_width and width > source_width and width != widths[0]:
+            continue
+        geometry = '{}x{}'.format(width, round(width * card_height / card_width))
+        for format_ in responsive_formats():
+            made[geometry, format_] = dict(options, format=format_)
+    return [
+        (geometry, format_, options)
+        for (geometry, format_), options in made.items()
+        ]
+
+
+def image_exists(image):
+    if not image:
+        return False
+    try:
+        return image.storage.exists(image.name)
+    except (SuspiciousFileOperation, OSError):
+        return False
+
+
+def generate(post_id):
+    """renders every configured geometry of a post image and records it"""
+    post = Post.objects.filter(id=post_id).only(
+        'id', 'image', 'author_id', 'group_id'
+        ).first()
+    if post is None:
+        return []
+    PostThumbnail.objects.filter(post_id=post_id).exclude(
+        source=post.image.name or ''
+        ).delete()
+    if not image_exists(post.image):
+        return []
+    made = []
+    for geometry, format_, options in variants(post.image.width):
+        thumbnail = get_thumbnail(post.image, geometry, **options)
+        record, _ = PostThumbnail.objects.update_or_create(
+            post_id=post_id, geometry=geometry, format=format_,
+            defaults={
+                'source': post.image.name,
+                'name': thumbnail.name,
+                'width': thumbnail.width,
+                'height': thumbnail.height,
+                }
+            )
+        made.append(record)
+    refresh_card(post)
+    return made
+
+
+def refresh_card(post):
+    """re-renders the card and the pages of a post with new thumbnails"""
+    from .signals import invalidate_pages
+
+    Post.objects.filter(id=post.id).update(updated=timezone.now())
+    invalidate_pages([post.author_id], [post.group_id])
+
+
+def _run(post_id):
+    try:
+        generate(post_id)
+    except Exception:
+        logger.exception('thumbnails of post %s failed', post_id)
+    finally:
+        close_old_connections()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=workers(),
+            thread_name_prefix='thumbnails'
+            )
+    return _executor
+
+
+def in_background():
+    """whether thumbnails are generated by the worker threads"""
+    return workers() > 0
+
+
+def schedule(post):
+    """generates the thumbnails after the transaction commits
+
+    The work runs in a local background thread pool, so the request that
+    uploaded the image does not wait for the decoding and resizing. With
+    POSTS_THUMBNAIL_WORKERS = 0, as in the tests, it runs inline instead.
+    """
+    if not image_exists(post.image):
+        return
+
+    def submit():
+        if in_background():
+            _get_executor().submit(_run, post.id)
+            return
+        try:
+            generate(post.id)
+        except Exception:
+            logger.exception('thumbnails of post %s failed', post.id)
+
+    transaction.on_commit(submit)
+
+
+def current(post):
+    """recorded thumbnails of the current post image"""
+    return [
+        thumbnail for thumbnail in post.thumbnails.all()
+        if thumbnail.source == post.image.name
+        ]
+
+
+def find(post, geometry, format_='JPEG'):
+    """the recorded thumbnail of the current post image, or None"""
+    for thumbnail in current(post):
+        if thumbnail.geometry == geometry and thumbnail.format == format_:
+            return thumbnail
+    return None
+
+
+def missing(post):
+    """whether variants that every image gets were never generated"""
+    have = {(thumbnail.geometry, thumbnail.format) for thumbnail in current(post)}
+    return any(
+        (geometry, format_) not in have
+        for geometry, format_, _ in variants(source_width=1)
+        )
+
+
+def srcsets(post):
+    """(mime type, srcset) per responsive format, [] until generated
+
+    The last entry is the fallback format for the <img> itself.
+    """
+    widths = {}
+    for thumbnail in current(post):
+        if thumbnail.format in responsive_formats():
+            widths.setdefault(thumbnail.format, {})[thumbnail.width] = thumbnail
+    sets = []
+    for format_ in responsive_formats():
+        if format_ not in widths:
+            continue
+        sets.append((MIME_TYPES.get(format_, ''), ', '.join(
+            '{} {}w'.format(thumbnail.url, width)
+            for width, thumbnail in sorted(widths[format_].items())
+            )))
+    return sets
@@ -1,22 +1,34 @@
 from django import forms
+from django.conf import settings
 from django.http import request
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.views.decorators.cache import cache_page
+from django.db.models import prefetch_related_objects
+from yatube.budgets import query_budget
 
 from .models import Post, Group, User, Comment, Follow
 from .forms import PostForm, CommentForm
+from .caching import (
+    author_scope, shared_page_by_generation, condition_by_generation,
+    group_scope, scoped_key
+    )
+from .counters import author_stats
+from .feed import feed_size, timeline_posts
+from .pagination import cached_count, paginate
+from .search import search_posts
 
 
-@cache_page(1 * 20, key_prefix="index_page")
+@query_budget(5)
+@shared_page_by_generation(lambda: ['posts'], key_prefix="index_page")
 def index(request):
     """home page with a list of posts"""
-    latest = Post.objects.order_by("-pub_date").all()
-    paginator = Paginator(latest, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    latest = Post.objects.feed().order_by("-pub_date")
+    paginator, page = paginate(
+        request, latest, settings.POSTS_PER_PAGE,
+        count=lambda: cached_count(latest, scoped_key('count', 'posts'))
+        )
     return render(
         request,
         "index.html",
@@ -24,13 +36,23 @@ def index(request):
         )
 
 
+@query_budget(6)
+@condition_by_generation(
+    lambda slug: [group_scope(slug)], key_prefix="group_page"
+    )
+@shared_page_by_generation(
+    lambda slug: [group_scope(slug)], key_prefix="group_page"
+    )
 def group_posts(request, slug):
     """group page with a list of posts"""
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts = group.posts.feed()
+    paginator, page = paginate(
+        request, posts, settings.POSTS_PER_PAGE,
+        count=lambda: cached_count(
+            posts, scoped_key('count', group_scope(slug))
+            )
+        )
     return render(
         request,
         "group.html",
@@ -38,6 +60,7 @@ def group_posts(request, slug):
         )
 
 
+@query_budget(3)
 @login_required
 def new_post(request):
     """creating a new post by an authorized user"""
@@ -50,22 +73,24 @@ def new_post(request):
     return render(request, 'new_post.html', {'form': form, 'edit': False})
 
 
+@query_budget(7)
+@condition_by_generation(
+    lambda username: [author_scope(username)], key_prefix="profile_page"
+    )
+@shared_page_by_generation(
+    lambda username: [author_scope(username)], key_prefix="profile_page"
+    )
 def profile(request, username):
     """displaying the user's profile page with their posts,
     the number of followers and following
     """
-    user = request.user
     author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    paginator = Paginator(posts, 5)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    follower = author.follower.count()
-    following = author.following.count()
-    if request.user.is_authenticated is True:
-        follow = Follow.objects.filter(author=author, user=user).exists()
-    else:
-        follow = ''
+    posts = author.posts.feed()
+    stats = author_stats(author)
+    paginator, page = paginate(
+        request, posts, settings.POSTS_PROFILE_PER_PAGE,
+        count=stats.posts_count
+        )
     return render(
         request,
         'profile.html',
@@ -74,19 +99,31 @@ def profile(request, username):
             'posts': posts,
             'paginator': paginator,
             'page': page,
-            'follower': follower,
-            'following': following,
-            'follow': follow
+            'stats': stats,
+            'follower': stats.following_count,
+            'following': stats.followers_count,
             }
         )
 
 
+@query_budget(7)
+@condition_by_generation(
+    lambda username, post_id: [author_scope(username)], key_prefix="post_page"
+    )
+@shared_page_by_generation(
+    lambda username, post_id: [author_scope(username)], key_prefix="post_page"
+    )
 def post_view(request, username, post_id):
     """displaying a post, comment form, and list of comments"""
-    post = get_object_or_404(Post, author__username=username, id=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'),
+        author__username=username, id=post_id
+        )
+    if post.image:
+        # read by both the <img> and the srcsets of the card
+        prefetch_related_objects([post], 'thumbnails')
     author = post.author
-    follower = author.follower.count()
-    following = author.following.count()
+    stats = author_stats(author)
     comments = Comment.objects.select_related('author', 'post').filter(post_id=post_id)
     form = CommentForm()
     return render(
@@ -97,13 +134,15 @@ def post_view(request, username, post_id):
             'post': post,
             'comments': comments,
             'form': form,
-            'follower': follower,
-            'following': following,
+            'stats': stats,
+            'follower': stats.following_count,
+            'following': stats.followers_count,
             'item': True
             }
         )
 
 
+@query_budget(5)
 @login_required
 def post_edit(request, username, post_id):
     """edits the text, group, or image for a post"""
@@ -147,14 +186,15 @@ def add_comment(request, username, post_id):
     return redirect('post', username=username, post_id=post_id)
 
 
+@query_budget(6)
 @login_required
 def follow_index(request):
     """the display of the ribbon with the tracked records of the authors"""
-    user = request.user
-    latest = Post.objects.filter(author__following__user=user)
-    paginator = Paginator(latest, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    latest = timeline_posts(request.user).feed()
+    paginator, page = paginate(
+        request, latest, settings.POSTS_PER_PAGE,
+        count=lambda: feed_size(request.user)
+        )
     return render(request, "follow.html", {"page": page, "paginator": paginator})
 
 
@@ -169,7 +209,6 @@ def profile_follow(request, username):
 
 
 @login_required
-@cache_page(1 * 20, key_prefix="index_page")
 def profile_unfollow(request, username):
     """stops following the author"""
     user = request.user
@@ -195,29 +234,29 @@ def comment_delete(request, username, post_id, author_comment, comment_id):
     return redirect('post', username=username, post_id=post_id)
 
 
+@query_budget(6)
 def search_post(request):
     """Search for a post by the content of the 'text' field"""
-    search_query = request.GET.get('search_query')
-    if search_query != "":
-        latest = Post.objects.order_by("-pub_date").filter(text__icontains=search_query)
-        if latest.exists():
-            paginator = Paginator(latest, 20)
-            page_number = request.GET.get('page')
-            page = paginator.get_page(page_number)
-            return render(
-                request,
-                "search_results.html",
-                {"page": page, "paginator": paginator, "search": True}
-                )
-        else:
-            return render(
-                request,
-                "search_results.html",
-                {"text": "По Вашему запросу ничего не найдено.", "search": False}
-                )
-    else:
+    search_query = request.GET.get('search_query') or ''
+    if not search_query.strip():
         return render(
             request,
             "search_results.html",
             {"text": "Пустой запрос", "search": False}
             )
+    found = search_posts(search_query)
+    if not found:
+        return render(
+            request,
+            "search_results.html",
+            {"text": "По Вашему запросу ничего не найдено.", "search": False}
+            )
+    paginator = Paginator(found, settings.POSTS_SEARCH_PER_PAGE)
+    page = paginator.get_page(request.GET.get('page'))
+    posts = Post.objects.feed().in_bulk(page.object_list)
+    page.object_list = [posts[pk] for pk in page.object_list if pk in posts]
+    return render(
+        request,
+        "search_results.html",
+        {"page": page, "paginator": paginator, "search": True}
+        )
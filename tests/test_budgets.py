@@ -0,0 +1,10 @@
+class TestQueryBudgets:
+
+    def test_pages_within_budget(self, query_budgets):
+        for name in ('index', 'group_posts', 'profile', 'post',
+                     'follow_index', 'search_post'):
+            query_budgets.check(query_budgets.path(name))
+
+    def test_no_queries_per_item(self, query_budgets):
+        for name in ('index', 'group_posts', 'profile', 'follow_index'):
+            query_budgets.check_growth(query_budgets.path(name))
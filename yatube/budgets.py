@@ -0,0 +1,140 @@
+"""per-view SQL query budgets
+
+A view declares the most queries a GET request to it may run, session
+and user lookups included, with the query_budget decorator. QueryLog records
+the queries run on every connection together with where they came from:
+the project frames of the stack and the template lines being rendered,
+so a report points at the {% for %} or the template tag that runs a
+query per item. The budgets are checked by the pytest plugin
+yatube.pytest_budgets and, in production, by MetricsMiddleware.
+"""
+import os
+import re
+import traceback
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+TEMPLATE_BASE = os.path.join('django', 'template', 'base.py')
+# literals and IN lists stripped from SQL to tell the statements of a
+# loop apart
+LITERALS_REGEX = re.compile(r"'(?:[^']|'')*'|\b\d+\b|\((?:%s, )*%s\)")
+
+
+def query_budget(queries):
+    """declares the most SQL queries a GET request to the view may run"""
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
+
+
+def budget_of(view):
+    return getattr(view, 'query_budget', None)
+
+
+class BudgetExceeded(AssertionError):
+    pass
+
+
+def _origin():
+    """project frames and template lines, outermost first"""
+    lines = []
+    for frame, lineno in traceback.walk_stack(None):
+        path = frame.f_code.co_filename
+        if path.endswith(TEMPLATE_BASE):
+            node = frame.f_locals.get('self')
+            if frame.f_code.co_name != 'render_annotated' or node is None:
+                continue
+            token = getattr(node, 'token', None)
+            origin = getattr(node, 'origin', None)
+            if token is None or origin is None:
+                continue
+            line = '  {}:{} {{% {} %}}'.format(
+                origin.template_name, token.lineno, token.contents
+                )
+            if lines and lines[-1].startswith(
+                    '  {}:'.format(origin.template_name)):
+                # the innermost node of each template is enough
+                continue
+            lines.append(line)
+        elif (path.startswith(settings.BASE_DIR)
+              and 'site-packages' not in path
+              and path != __file__):
+            lines.append('  {}:{} in {}'.format(
+                os.path.relpath(path, settings.BASE_DIR), lineno,
+                frame.f_code.co_name
+                ))
+    return lines[::-1]
+
+
+class QueryLog:
+
+    """the queries run on every connection inside the with block"""
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(
+                connection.execute_wrapper(self._record)
+                )
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __len__(self):
+        return len(self.queries)
+
+    def _record(self, execute, sql, params, many, context):
+        self.queries.append((sql, _origin()))
+        return execute(sql, params, many, context)
+
+    def statements(self):
+        """how many times each statement ran, literals aside"""
+        return Counter(
+            LITERALS_REGEX.sub('?', sql) for sql, _ in self.queries
+            )
+
+    def report(self, only=None):
+        """the queries with their origins, of the statements in only"""
+        blocks = []
+        for number, (sql, origin) in enumerate(self.queries, 1):
+            if only is not None and LITERALS_REGEX.sub('?', sql) not in only:
+                continue
+            blocks.append('\n'.join(
+                ['{}. {}'.format(number, sql)] + origin
+                ))
+        return '\n\n'.join(blocks)
+
+
+def check_budget(name, log, budget):
+    """raises BudgetExceeded if the log holds more than budget queries"""
+    if budget is not None and len(log) > budget:
+        raise BudgetExceeded(
+            '{}: {} запросов при бюджете {}\n\n{}'.format(
+                name, len(log), budget, log.report()
+                )
+            )
+
+
+def check_growth(name, small, large):
+    """raises BudgetExceeded if the statements of large repeat more often
+    than those of small, i.e. a query runs per item of the page
+    """
+    before = small.statements()
+    grown = {
+        statement for statement, count in large.statements().items()
+        if count > before[statement]
+        }
+    if grown:
+        raise BudgetExceeded(
+            '{}: N+1, число запросов растёт с размером страницы ({} -> {})'
+            '\n\n{}'.format(name, len(small), len(large), large.report(grown))
+            )
@@ -0,0 +1,402 @@
+"""two-tier cache shared by the worker processes of a host
+
+L1 is a bounded LRU inside every process, L2 a SQLite database on local
+disk that all workers open in WAL mode, so no cache server is needed.
+Every write goes to L2 in one transaction with a row in an invalidation
+journal. Before answering, a process checks whether another connection
+has committed since (PRAGMA data_version) and, if so, replays the new
+journal rows, dropping those keys from its L1.
+
+L1 hits, L2 hits, misses and L1 evictions are counted per key
+prefix, the part of the key before the first ':' or '|', and written to
+L2 every STATS_INTERVAL seconds for the cache_stats command.
+
+OPTIONS: L1_MAX_ENTRIES, L1_TIMEOUT (seconds an L1 copy lives at most),
+JOURNAL_SIZE, STATS_INTERVAL, BUSY_TIMEOUT; MAX_ENTRIES and
+CULL_FREQUENCY bound L2.
+"""
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from yatube.metrics import count_cache_lookup
+
+COUNTERS = ('l1_hits', 'l2_hits', 'misses', 'evictions')
+PREFIX_REGEX = re.compile(r'[^:|]*')
+# L2 is culled and the journal pruned on every this many writes
+MAINTENANCE_EVERY = 100
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+    # a NULL key invalidates everything
+    'CREATE TABLE IF NOT EXISTS journal ('
+    ' id INTEGER PRIMARY KEY AUTOINCREMENT, pid INTEGER NOT NULL, key TEXT)',
+    'CREATE TABLE IF NOT EXISTS stats ('
+    ' pid INTEGER NOT NULL, prefix TEXT NOT NULL, l1_hits INTEGER,'
+    ' l2_hits INTEGER, misses INTEGER, evictions INTEGER, updated REAL,'
+    ' PRIMARY KEY (pid, prefix))',
+)
+LIVE = '(expires IS NULL OR expires > ?)'
+
+# process state by location, shared by the per-thread cache instances
+_processes = {}
+_processes_lock = threading.Lock()
+
+
+def key_prefix(key):
+    return PREFIX_REGEX.match(key).group() or key
+
+
+class _Process:
+
+    """L1 and counters of one process"""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.last_id = None
+        # bumped by every L1 invalidation, so a value read from L2 before
+        # one is not put into L1 after it
+        self.changes = 0
+        self.counts = defaultdict(lambda: [0] * len(COUNTERS))
+        self.flushed = time.monotonic()
+
+
+class TieredCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self._l1_timeout = options.get('L1_TIMEOUT', 60)
+        self._journal_size = int(options.get('JOURNAL_SIZE', 10000))
+        self._stats_interval = options.get('STATS_INTERVAL', 10)
+        self._busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self._local = threading.local()
+
+    @property
+    def _process(self):
+        with _processes_lock:
+            process = _processes.get(self._path)
+            if process is None or process.pid != os.getpid():
+                # a forked worker starts cold rather than share counters
+                process = _processes[self._path] = _Process()
+            return process
+
+    @property
+    def _cache(self):
+        """the L1 entries of this process"""
+        return self._process.entries
+
+    def _db(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(
+                self._path, timeout=self._busy_timeout,
+                isolation_level=None, check_same_thread=False
+                )
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                db.execute(statement)
+            local.db, local.pid, local.version = db, os.getpid(), None
+        return local.db
+
+    @contextmanager
+    def _write(self, db):
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _sync(self, db, process):
+        """drops L1 entries that other processes changed"""
+        version = db.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._local.version and process.last_id is not None:
+            return
+        self._local.version = version
+        if process.last_id is None:
+            last_id = db.execute(
+                'SELECT COALESCE(MAX(id), 0) FROM journal'
+                ).fetchone()[0]
+            with process.lock:
+                if process.last_id is None:
+                    process.last_id = last_id
+            return
+        rows = db.execute(
+            'SELECT id, pid, key FROM journal WHERE id > ? ORDER BY id',
+            (process.last_id,)
+            ).fetchall()
+        if not rows:
+            return
+        with process.lock:
+            if rows[0][0] != process.last_id + 1:
+                # the rows in between were pruned: anything may be stale
+                process.entries.clear()
+            for _, pid, key in rows:
+                if pid == process.pid:
+                    continue
+                if key is None:
+                    process.entries.clear()
+                else:
+                    process.entries.pop(key, None)
+            process.last_id = max(process.last_id, rows[-1][0])
+            process.changes += 1
+
+    def _journal(self, db, key):
+        row_id = db.execute(
+            'INSERT INTO journal (pid, key) VALUES (?, ?)', (os.getpid(), key)
+            ).lastrowid
+        if row_id % MAINTENANCE_EVERY == 0:
+            db.execute(
+                'DELETE FROM journal WHERE id <= ?',
+                (row_id - self._journal_size,)
+                )
+            self._cull(db)
+
+    def _cull(self, db):
+        db.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            (time.time(),)
+            )
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            db.execute('DELETE FROM cache')
+            return
+        # culled values did not change, so L1 copies may stay
+        db.execute(
+            'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+            'ORDER BY expires IS NULL, expires LIMIT ?)',
+            (count // self._cull_frequency,)
+            )
+
+    def _remember(self, process, key, pickled, expires, prefix):
+        """puts a value into L1, called with the process lock held"""
+        limit = time.time() + self._l1_timeout
+        if expires is not None:
+            limit = min(limit, expires)
+        process.entries[key] = (pickled, limit, prefix)
+        process.entries.move_to_end(key)
+        while len(process.entries) > self._l1_max_entries:
+            _, (_, _, evicted) = process.entries.popitem(last=False)
+            process.counts[evicted][3] += 1
+
+    def _forget(self, process, key):
+        with process.lock:
+            process.changes += 1
+            if key is None:
+                process.entries.clear()
+            else:
+                process.entries.pop(key, None)
+
+    def _flush_stats(self, db, process, force=False):
+        now = time.monotonic()
+        if not force and now - process.flushed < self._stats_interval:
+            return
+        process.flushed = now
+        with process.lock:
+            rows = [
+                (process.pid, prefix) + tuple(counts) + (time.time(),)
+                for prefix, counts in process.counts.items()
+                ]
+        if not rows:
+            return
+        with self._write(db):
+            db.executemany(
+                'INSERT OR REPLACE INTO stats VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows
+                )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        prefix = key_prefix(key)
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        expires = self.get_backend_timeout(timeout)
+        db, process = self._db(), self._process
+        with self._write(db):
+            if db.execute(
+                    'SELECT 1 FROM cache WHERE key = ? AND ' + LIVE,
+                    (key, time.time())).fetchone():
+                return False
+            db.execute(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?)',
+                (key, pickled, expires)
+                )
+            self._journal(db, key)
+        self._forget(process, key)
+        with process.lock:
+            self._remember(process, key, pickled, expires, prefix)
+        return True
+
+    def get(self, key, default=None, version=None):
+        prefix = key_prefix(key)
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        db, process = self._db(), self._process
+        self._sync(db, process)
+        now = time.time()
+        with process.lock:
+            entry = process.entries.get(key)
+            if entry is not None and entry[1] <= now:
+                del process.entries[key]
+                entry = None
+            if entry is not None:
+                process.entries.move_to_end(key)
+                process.counts[prefix][0] += 1
+                count_cache_lookup(True)
+            changes = process.changes
+        if entry is not None:
+            pickled = entry[0]
+        else:
+            row = db.execute(
+                'SELECT value, expires FROM cache WHERE key = ? AND ' + LIVE,
+                (key, now)
+                ).fetchone()
+            with process.lock:
+                count_cache_lookup(row is not None)
+                if row is None:
+                    process.counts[prefix][2] += 1
+                else:
+                    process.counts[prefix][1] += 1
+                    if process.changes == changes:
+                        self._remember(process, key, row[0], row[1], prefix)
+            if row is None:
+                self._flush_stats(db, process)
+                return default
+            pickled = row[0]
+        self._flush_stats(db, process)
+        return pickle.loads(pickled)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        entries = []
+        for key, value in data.items():
+            made = self.make_key(key, version=version)
+            self.validate_key(made)
+            pickled = pickle.dumps(value, self.pickle_protocol)
+            entries.append((made, pickled, key_prefix(key)))
+        db, process = self._db(), self._process
+        with self._write(db):
+            for key, pickled, _ in entries:
+                db.execute(
+                    'INSERT OR REPLACE INTO cache VALUES (?, ?, ?)',
+                    (key, pickled, expires)
+                    )
+                self._journal(db, key)
+        for key, pickled, prefix in entries:
+            self._forget(process, key)
+            with process.lock:
+                self._remember(process, key, pickled, expires, prefix)
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        db = self._db()
+        with self._write(db):
+            touched = db.execute(
+                'UPDATE cache SET expires = ? WHERE key = ? AND ' + LIVE,
+                (self.get_backend_timeout(timeout), key, time.time())
+                ).rowcount
+            self._journal(db, key)
+        self._forget(self._process, key)
+        return bool(touched)
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        db = self._db()
+        with self._write(db):
+            db.execute('DELETE FROM cache WHERE key = ?', (key,))
+            self._journal(db, key)
+        self._forget(self._process, key)
+
+    def incr(self, key, delta=1, version=None):
+        prefix = key_prefix(key)
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        db, process = self._db(), self._process
+        with self._write(db):
+            row = db.execute(
+                'SELECT value, expires FROM cache WHERE key = ? AND ' + LIVE,
+                (key, time.time())
+                ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            new_value = pickle.loads(row[0]) + delta
+            pickled = pickle.dumps(new_value, self.pickle_protocol)
+            db.execute(
+                'UPDATE cache SET value = ? WHERE key = ?', (pickled, key)
+                )
+            self._journal(db, key)
+        self._forget(process, key)
+        with process.lock:
+            self._remember(process, key, pickled, row[1], prefix)
+        return new_value
+
+    def clear(self):
+        db = self._db()
+        with self._write(db):
+            db.execute('DELETE FROM cache')
+            self._journal(db, None)
+        self._forget(self._process, None)
+
+    def close(self, **kwargs):
+        # the connection is kept for the next request of the thread
+        pass
+
+    def stats(self, everywhere=False):
+        """{prefix: {counter: n}} of this process, or summed over the
+        processes that wrote their counters to L2"""
+        process = self._process
+        if not everywhere:
+            with process.lock:
+                return {
+                    prefix: dict(zip(COUNTERS, counts))
+                    for prefix, counts in process.counts.items()
+                    }
+        db = self._db()
+        self._flush_stats(db, process, force=True)
+        rows = db.execute(
+            'SELECT prefix, SUM(l1_hits), SUM(l2_hits), SUM(misses), '
+            'SUM(evictions) FROM stats GROUP BY prefix ORDER BY prefix'
+            ).fetchall()
+        return {row[0]: dict(zip(COUNTERS, row[1:])) for row in rows}
+
+    def reset_stats(self):
+        process = self._process
+        with process.lock:
+            process.counts.clear()
+        db = self._db()
+        with self._write(db):
+            db.execute('DELETE FROM stats')
+
+    def size(self):
+        """(entries in the L1 of this process, live entries in L2)"""
+        live = self._db().execute(
+            'SELECT COUNT(*) FROM cache WHERE ' + LIVE, (time.time(),)
+            ).fetchone()[0]
+        return len(self._process.entries), live
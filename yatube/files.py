@@ -0,0 +1,190 @@
+"""media and static files served by the application
+
+FILE_SERVE_MODE picks how the bytes leave the process:
+
+* 'python' streams the file from the worker with FileResponse, answering
+  Range requests with 206 and conditional requests with 304;
+* 'sendfile' hands the absolute path to the front server in X-Sendfile
+  (Apache mod_xsendfile, lighttpd);
+* 'accel' hands an internal location to nginx in X-Accel-Redirect,
+  FILE_SERVE_ACCEL_LOCATIONS maps each document root to one.
+
+In every mode the conditional headers are answered here, and names that
+carry a content hash are cached by browsers for good.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotModified,
+    StreamingHttpResponse
+    )
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags
+from django.views.static import was_modified_since
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+CHUNK_SIZE = 64 * 1024
+RANGE_REGEX = re.compile(r'^bytes=(\d*)-(\d*)$')
+# 12 hex digits from ManifestStaticFilesStorage, sha256 and sorl names
+HASHED_NAME_REGEX = re.compile(
+    r'(\.[0-9a-f]{12}\.[^/.]+|/[0-9a-f]{32,64}\.[^/.]+)$'
+    )
+
+
+class HashedStaticFilesStorage(ManifestStaticFilesStorage):
+
+    """static files under names with a content hash
+
+    Until collectstatic has written the manifest, names that are missing
+    from it are served unhashed instead of failing the page.
+    """
+
+    manifest_strict = False
+
+    def url(self, name, force=False):
+        try:
+            return super().url(name, force)
+        except ValueError:
+            return FileSystemStorage.url(self, name)
+
+
+def _etag(stats):
+    return '"{:x}-{:x}"'.format(stats.st_mtime_ns, stats.st_size)
+
+
+def _not_modified(request, etag, stats):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        tags = parse_etags(if_none_match)
+        return '*' in tags or etag in tags
+    return not was_modified_since(
+        request.META.get('HTTP_IF_MODIFIED_SINCE'),
+        stats.st_mtime, stats.st_size
+        )
+
+
+def _byte_range(request, etag, size):
+    """(start, end) of a single satisfiable range, None for the whole file
+
+    Raises ValueError for a range outside the file.
+    """
+    header = request.META.get('HTTP_RANGE')
+    if not header or size == 0:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is not None and if_range != etag:
+        return None
+    match = RANGE_REGEX.match(header.strip())
+    if match is None:
+        # multiple or unknown ranges: the whole file is a valid answer
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as source:
+        source.seek(start)
+        while length > 0:
+            chunk = source.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def _offload(path, document_root):
+    mode = getattr(settings, 'FILE_SERVE_MODE', 'python')
+    if mode == 'sendfile':
+        return 'X-Sendfile', path
+    if mode == 'accel':
+        locations = getattr(settings, 'FILE_SERVE_ACCEL_LOCATIONS', {})
+        location = locations.get(str(document_root))
+        if location is None:
+            return None
+        relative = os.path.relpath(path, document_root).replace(os.sep, '/')
+        return 'X-Accel-Redirect', quote(posixpath.join(location, relative))
+    return None
+
+
+def serve(request, path, document_root=None, max_age=None):
+    """a file under document_root, streamed or handed to the front server"""
+    try:
+        fullpath = safe_join(document_root, path)
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден')
+    try:
+        stats = os.stat(fullpath)
+    except OSError:
+        raise Http404('Файл не найден')
+    if not stat.S_ISREG(stats.st_mode):
+        raise Http404('Файл не найден')
+
+    etag = _etag(stats)
+    if HASHED_NAME_REGEX.search('/' + path):
+        cache_control = IMMUTABLE
+    else:
+        if max_age is None:
+            max_age = getattr(settings, 'FILE_SERVE_MAX_AGE', 60 * 60)
+        cache_control = 'public, max-age={}'.format(max_age)
+    if _not_modified(request, etag, stats):
+        response = HttpResponseNotModified()
+    else:
+        content_type, encoding = mimetypes.guess_type(fullpath)
+        content_type = content_type or 'application/octet-stream'
+        offload = _offload(fullpath, document_root)
+        if offload is not None:
+            # the front server reads the file and answers Range itself
+            response = HttpResponse(content_type=content_type)
+            response[offload[0]] = offload[1]
+        else:
+            response = _stream(request, fullpath, etag, stats, content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Last-Modified'] = http_date(stats.st_mtime)
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def _stream(request, fullpath, etag, stats, content_type):
+    size = stats.st_size
+    try:
+        byte_range = _byte_range(request, etag, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{}'.format(size)
+        return response
+    if byte_range is None:
+        response = FileResponse(
+            open(fullpath, 'rb'), content_type=content_type
+            )
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(fullpath, start, end - start + 1),
+            status=206, content_type=content_type
+            )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,321 @@
+"""per-request timings, Server-Timing and Prometheus metrics
+
+MetricsMiddleware measures every request: the SQL queries run on every
+database connection and their time, template rendering (including the
+queries run from templates), cache lookups of the tiered cache and the
+time of the whole request. They are sent back in a Server-Timing header
+and added to counters and latency histograms per URL name. A GET request
+running more queries than the query_budget of its view is logged and
+counted.
+
+Templates are timed by the TimedDjangoTemplates backend. Every process
+writes its totals to the SQLite file METRICS_DB at most every
+METRICS_FLUSH_INTERVAL seconds, and the metrics view serves their sum
+over the processes in the Prometheus text format to staff users and to
+scrapers sending METRICS_TOKEN.
+"""
+import hmac
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.template.backends.django import DjangoTemplates
+from django.template.backends.django import Template as BackendTemplate
+
+from .budgets import budget_of
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FAMILIES = {
+    'yatube_requests_total': (
+        'counter', 'Requests by URL name and status'),
+    'yatube_request_duration_seconds': (
+        'histogram', 'Time from the first middleware to the response'),
+    'yatube_db_queries_total': ('counter', 'SQL queries run by requests'),
+    'yatube_db_duration_seconds_total': (
+        'counter', 'Time spent in SQL queries'),
+    'yatube_template_duration_seconds_total': (
+        'counter', 'Time spent rendering templates'),
+    'yatube_cache_hits_total': ('counter', 'Cache lookups that hit'),
+    'yatube_cache_misses_total': ('counter', 'Cache lookups that missed'),
+    'yatube_query_budget_exceeded_total': (
+        'counter', 'GET requests running more queries than their budget'),
+}
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS samples ('
+    ' pid INTEGER NOT NULL, name TEXT NOT NULL, labels TEXT NOT NULL,'
+    ' value REAL NOT NULL, PRIMARY KEY (pid, name, labels))'
+)
+
+_local = threading.local()
+logger = logging.getLogger(__name__)
+
+
+class RequestMetrics:
+
+    """what one request spent its time on"""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.templates = 0.0
+        self.rendering = False
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.total = 0.0
+
+    def server_timing(self):
+        return ', '.join((
+            'db;dur={:.1f};desc="{} queries"'.format(
+                self.sql * 1000, self.queries),
+            'tpl;dur={:.1f}'.format(self.templates * 1000),
+            'cache;desc="{} hits, {} misses"'.format(
+                self.cache_hits, self.cache_misses),
+            'total;dur={:.1f}'.format(self.total * 1000),
+            ))
+
+
+def current():
+    """metrics of the request the thread is serving, None outside one"""
+    return getattr(_local, 'metrics', None)
+
+
+def count_cache_lookup(hit):
+    metrics = current()
+    if metrics is None:
+        return
+    if hit:
+        metrics.cache_hits += 1
+    else:
+        metrics.cache_misses += 1
+
+
+class TimedTemplate(BackendTemplate):
+
+    """a template of TimedDjangoTemplates, adding its render time to the
+    metrics of the request
+    """
+
+    def render(self, context=None, request=None):
+        metrics = current()
+        if metrics is None or metrics.rendering:
+            # nested render_to_string calls are part of the outer render
+            return super().render(context, request)
+        metrics.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.templates += time.perf_counter() - started
+            metrics.rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+
+    """the Django template backend with its renders timed"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(
+            super().from_string(template_code).template, self
+            )
+
+    def get_template(self, template_name):
+        return TimedTemplate(
+            super().get_template(template_name).template, self
+            )
+
+
+def _query_timer(metrics):
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics.queries += 1
+            metrics.sql += time.perf_counter() - started
+    return wrapper
+
+
+def _labels(**labels):
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace(
+            '"', r'\"'))
+        for name, value in labels.items()
+        )
+
+
+class Registry:
+
+    """totals of one process, flushed to METRICS_DB"""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.values = defaultdict(float)
+        self.flushed = time.monotonic()
+
+    def observe(self, view, status, metrics, over_budget=False):
+        labels = _labels(view=view)
+        with self.lock:
+            values = self.values
+            values['yatube_requests_total', _labels(
+                view=view, status=status)] += 1
+            for bucket in BUCKETS:
+                values['yatube_request_duration_seconds_bucket', _labels(
+                    view=view, le=bucket)] += metrics.total <= bucket
+            values['yatube_request_duration_seconds_bucket', _labels(
+                view=view, le='+Inf')] += 1
+            values['yatube_request_duration_seconds_sum', labels] += (
+                metrics.total)
+            values['yatube_request_duration_seconds_count', labels] += 1
+            values['yatube_db_queries_total', labels] += metrics.queries
+            values['yatube_db_duration_seconds_total', labels] += metrics.sql
+            values['yatube_template_duration_seconds_total', labels] += (
+                metrics.templates)
+            values['yatube_cache_hits_total', labels] += metrics.cache_hits
+            values['yatube_cache_misses_total', labels] += (
+                metrics.cache_misses)
+            if over_budget:
+                values['yatube_query_budget_exceeded_total', labels] += 1
+        self.flush()
+
+    def flush(self, force=False):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+        now = time.monotonic()
+        if not force and now - self.flushed < interval:
+            return
+        self.flushed = now
+        with self.lock:
+            rows = [
+                (self.pid, name, labels, value)
+                for (name, labels), value in self.values.items()
+                ]
+        with _samples() as db:
+            db.executemany(
+                'INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?)', rows
+                )
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def registry():
+    """the registry of this process; a forked worker starts from zero"""
+    with _registries_lock:
+        pid = os.getpid()
+        if pid not in _registries:
+            _registries.clear()
+            _registries[pid] = Registry()
+        return _registries[pid]
+
+
+@contextmanager
+def _samples():
+    """a connection to METRICS_DB inside a transaction"""
+    path = settings.METRICS_DB
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path, timeout=5)
+    try:
+        with db:
+            db.execute(SCHEMA)
+            yield db
+    finally:
+        db.close()
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = _local.metrics = RequestMetrics()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(_query_timer(metrics))
+                        )
+                response = self.get_response(request)
+        finally:
+            _local.metrics = None
+        metrics.total = time.perf_counter() - started
+        if getattr(settings, 'METRICS_SERVER_TIMING', True):
+            response['Server-Timing'] = metrics.server_timing()
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        budget = budget_of(match.func) if match else None
+        over_budget = (
+            budget is not None and request.method in ('GET', 'HEAD')
+            and metrics.queries > budget
+            )
+        if over_budget:
+            logger.warning(
+                '%s ran %d SQL queries, its budget is %d',
+                request.path, metrics.queries, budget
+                )
+        registry().observe(view, response.status_code, metrics, over_budget)
+        return response
+
+
+def _sort_key(row):
+    name, labels, _ = row
+    head, found, le = labels.rpartition(',le="')
+    if not found:
+        return name, labels, 0.0
+    # buckets in the order of their bounds, +Inf last
+    return name, head, float(le.rstrip('"'))
+
+
+def _has_token(request):
+    """whether the request carries METRICS_TOKEN as a bearer token"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        return False
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    scheme, _, sent = header.partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(
+        sent.strip().encode(), token.encode()
+        )
+
+
+def metrics(request):
+    """Prometheus text exposition of every process, for staff users and
+    requests with METRICS_TOKEN
+
+    The client address proves nothing behind a reverse proxy, which
+    connects from 127.0.0.1 on behalf of everyone.
+    """
+    user = getattr(request, 'user', None)
+    if not (user is not None and user.is_staff or _has_token(request)):
+        raise Http404('Страница не найдена')
+    registry().flush(force=True)
+    with _samples() as db:
+        rows = db.execute(
+            'SELECT name, labels, SUM(value) FROM samples '
+            'GROUP BY name, labels'
+            ).fetchall()
+    lines = []
+    family = None
+    for name, labels, value in sorted(rows, key=_sort_key):
+        base = name
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix) and name[:-len(suffix)] in FAMILIES:
+                base = name[:-len(suffix)]
+        if base != family:
+            family = base
+            kind, text = FAMILIES.get(base, ('untyped', base))
+            lines.append('# HELP {} {}'.format(base, text))
+            lines.append('# TYPE {} {}'.format(base, kind))
+        lines.append('{}{{{}}} {}'.format(name, labels, repr(value)))
+    return HttpResponse(
+        '\n'.join(lines) + '\n',
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
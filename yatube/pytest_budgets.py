@@ -0,0 +1,84 @@
+"""pytest plugin checking the query budgets of the views
+
+seeded_site fills the test database with the seed command, posts with
+images and recorded thumbnails included, and returns the benchmark's
+Target, the sample rows its URLs point at. query_budgets
+renders views for its reader and fails with the queries and where they
+came from when a view runs more than its query_budget, or when a bigger
+page runs more queries than a smaller one.
+"""
+from io import StringIO
+from urllib.parse import urlsplit
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import resolve
+
+from posts.management.commands.benchmark import Target
+
+from .budgets import QueryLog, budget_of, check_budget, check_growth
+
+PAGE_SIZES = (
+    'POSTS_PER_PAGE', 'POSTS_PROFILE_PER_PAGE', 'POSTS_SEARCH_PER_PAGE'
+    )
+# options of the seed command for the budget checks
+SEED = {
+    'users': 30, 'groups': 3, 'posts': 200, 'comments': 400,
+    'follows': 150, 'images': 0.3,
+    }
+
+
+class BudgetChecker:
+
+    """renders views and checks the queries they run"""
+
+    def __init__(self, client, target):
+        self.client = client
+        self.target = target
+
+    def path(self, name):
+        """the path of a URL name of posts.urls on the sample rows"""
+        method, path, _ = self.target.scenarios()[name]()
+        return path
+
+    def render(self, path):
+        """queries of a cold request: cached pages and counts would hide
+        the ones the budget is about
+        """
+        cache.clear()
+        with QueryLog() as log:
+            response = self.client.get(path)
+        assert response.status_code == 200, (
+            f'{path} ответил {response.status_code}'
+            )
+        return log
+
+    def check(self, path):
+        budget = budget_of(resolve(urlsplit(path).path).func)
+        assert budget is not None, f'у {path} нет query_budget'
+        log = self.render(path)
+        check_budget(path, log, budget)
+        return log
+
+    def check_growth(self, path, sizes=(3, 9)):
+        logs = []
+        for size in sizes:
+            with override_settings(**dict.fromkeys(PAGE_SIZES, size)):
+                logs.append(self.render(path))
+        check_growth(path, *logs)
+        return logs
+
+
+@pytest.fixture
+def seeded_site(db, settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    call_command('seed', stdout=StringIO(), **SEED)
+    return Target(None)
+
+
+@pytest.fixture
+def query_budgets(client, seeded_site):
+    client.force_login(seeded_site.user)
+    return BudgetChecker(client, seeded_site)
@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'yatube.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -66,7 +67,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "yatube.metrics.TimedDjangoTemplates",
         "DIRS": [TEMPLATES_DIR],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -139,9 +140,24 @@ USE_TZ = True
 STATIC_URL = "/static/"
 
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
+# collectstatic writes names with a content hash, cached for good
+STATICFILES_STORAGE = 'yatube.files.HashedStaticFilesStorage'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media') 
+# spreads post images over posts/ab/cd/ instead of one directory
+DEFAULT_FILE_STORAGE = 'posts.storage.ShardedStorage'
+
+# without DEBUG /media/ and /static/ are served by yatube.files.serve:
+# 'python' streams from the worker, 'sendfile' sets X-Sendfile and
+# 'accel' sets X-Accel-Redirect to the nginx internal location of the
+# document root; unhashed names are cached for FILE_SERVE_MAX_AGE seconds
+FILE_SERVE_MODE = 'python'
+FILE_SERVE_ACCEL_LOCATIONS = {
+    MEDIA_ROOT: '/protected/media/',
+    STATIC_ROOT: '/protected/static/',
+}
+FILE_SERVE_MAX_AGE = 60 * 60
 
 
 LOGIN_URL = "/auth/login/"
@@ -152,12 +168,107 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 SITE_ID = 1
 
+# 'page' keeps numbered ?page=N links, 'cursor' switches list views to
+# keyset pagination with ?after=/?before= tokens
+POSTS_PAGINATION = 'page'
+
+# posts per page of the lists, the profile and the search results
+POSTS_PER_PAGE = 10
+POSTS_PROFILE_PER_PAGE = 5
+POSTS_SEARCH_PER_PAGE = 20
+
+# list pages load slotted posts.models.FeedRow objects instead of Post
+# instances, which take less memory and time to build
+POSTS_FEED_ROWS = False
+
+# numbered pagination links this many pages around the current one
+POSTS_PAGINATOR_WINDOW = 2
+
+# posts of authors with at least this many followers are pulled into the
+# follow feed at read time instead of being pushed to every timeline
+POSTS_FANOUT_FOLLOWER_LIMIT = 1000
+POSTS_TIMELINE_BATCH_SIZE = 500
+
+# ranked search results are cached per normalized query for this many
+# seconds, at most POSTS_SEARCH_MAX_RESULTS ids each
+POSTS_SEARCH_CACHE_TIMEOUT = 30
+POSTS_SEARCH_MAX_RESULTS = 1000
+
+# posts.search.InvertedIndexBackend, posts.search.SQLiteFTSBackend (FTS5
+# tables, 'word' or 'trigram' mode) or posts.search.IContainsBackend
+POSTS_SEARCH_BACKEND = 'posts.search.InvertedIndexBackend'
+POSTS_SEARCH_FTS_MODE = 'word'
+
+# rendered post cards are keyed by post version, so they only expire to
+# free space
+POSTS_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# index, group and profile pages are keyed by content generations that
+# post, comment and follow changes bump; the timeout only frees space
+POSTS_PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# a stale or missing entry is rebuilt by one request holding a lock for
+# at most POSTS_CACHE_LOCK_TIMEOUT seconds; the others get the stale copy,
+# kept this long past its timeout, or wait up to POSTS_CACHE_LOCK_WAIT;
+# entries are rebuilt early with a chance growing toward their timeout
+POSTS_CACHE_LOCK_TIMEOUT = 10
+POSTS_CACHE_LOCK_WAIT = 2
+POSTS_CACHE_STALE_GRACE = 60
+POSTS_CACHE_EARLY_REFRESH_BETA = 1.0
+
+# thumbnails are generated after upload by a local pool of this many
+# threads (0 generates them inline) for every geometry listed here
+POSTS_THUMBNAIL_WORKERS = 2
+POSTS_THUMBNAIL_GEOMETRIES = {
+    '960x339': {'crop': 'center', 'upscale': True},
+}
+# the card geometry is also scaled to these widths in these formats for
+# the srcset of the card <picture>, the preferred format first
+POSTS_IMAGE_WIDTHS = (480, 960, 1440)
+POSTS_IMAGE_FORMATS = ('WEBP', 'JPEG')
+POSTS_IMAGE_SIZES = '(max-width: 1200px) 100vw, 1140px'
+
+# uploads past FILE_UPLOAD_MAX_MEMORY_SIZE stream to a temporary file;
+# images are checked from the header, originals larger than
+# POSTS_IMAGE_MAX_SIDE are downscaled and every decode has to fit the
+# budget in bytes: JPEGs are decoded at a scale that does, formats
+# decoded at full size get a lower pixel limit from it
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2 * 1024 * 1024
+POSTS_IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+POSTS_IMAGE_MAX_PIXELS = 50_000_000
+POSTS_IMAGE_MAX_SIDE = 2560
+POSTS_IMAGE_DECODE_BUDGET = 64 * 1024 * 1024
+# an image file saved this many seconds ago or less is kept when its
+# last post goes: another post may be about to use the same file
+POSTS_IMAGE_COLLECT_GRACE = 600
+
+# an LRU in every worker in front of a SQLite file shared by the workers
+# of the host; conftest.py gives test runs a directory of their own, so
+# no page cached by a previous run is served against a fresh database
+CACHE_DIR = os.path.join(BASE_DIR, 'cache')
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.cache.TieredCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 60,
+            'MAX_ENTRIES': 50000,
+            'CULL_FREQUENCY': 4,
+            'STATS_INTERVAL': 10,
+        },
     }
 }
 
+# request timings go out in a Server-Timing header and are summed over
+# the worker processes in METRICS_DB for /metrics, served to staff and to
+# scrapers sending "Authorization: Bearer <METRICS_TOKEN>"; no token set
+# means staff only
+METRICS_SERVER_TIMING = True
+METRICS_DB = os.path.join(CACHE_DIR, 'metrics.sqlite3')
+METRICS_FLUSH_INTERVAL = 10
+METRICS_TOKEN = None
+
 INTERNAL_IPS = [
     "127.0.0.1",
 ] 
\ No newline at end of file
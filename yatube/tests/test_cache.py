@@ -0,0 +1,95 @@
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from yatube.cache import TieredCache
+
+ROOT = tempfile.mkdtemp()
+
+
+class TieredCacheTests(SimpleTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.path = os.path.join(ROOT, self.id() + '.sqlite3')
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        return TieredCache(self.path, {'OPTIONS': options})
+
+    def other_worker(self, sql, *params):
+        """changes L2 the way another process would"""
+        db = sqlite3.connect(self.path, isolation_level=None)
+        key = self.cache.make_key('generation:pages')
+        db.execute(sql, params + (key,))
+        db.execute('INSERT INTO journal (pid, key) VALUES (0, ?)', (key,))
+        db.close()
+
+    def test_operations(self):
+        """the usual cache API over both tiers"""
+        cache = self.cache
+        self.assertIsNone(cache.get('missing'))
+        self.assertTrue(cache.add('generation:pages', 1))
+        self.assertFalse(cache.add('generation:pages', 5))
+        self.assertEqual(cache.incr('generation:pages'), 2)
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+        cache.set_many({'a': [1], 'b': None})
+        self.assertEqual(cache.get_many(['a', 'c']), {'a': [1]})
+        self.assertIsNone(cache.get('b', 'нет'))
+        cache.set('short', 1, -1)
+        self.assertIsNone(cache.get('short'))
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+        cache.clear()
+        self.assertIsNone(cache.get('generation:pages'))
+
+    def test_other_workers_invalidate_l1(self):
+        """a journaled write of another process reaches this L1"""
+        self.cache.set('generation:pages', 1)
+        self.assertEqual(self.cache.get('generation:pages'), 1)
+        self.other_worker(
+            'UPDATE cache SET value = ? WHERE key = ?', pickle.dumps(7)
+            )
+        self.assertEqual(self.cache.get('generation:pages'), 7)
+        self.other_worker('DELETE FROM cache WHERE key = ?')
+        self.assertIsNone(self.cache.get('generation:pages'))
+
+    def test_l2_is_shared(self):
+        """another instance reads what this one wrote"""
+        self.cache.set('post_card:1', 'карточка')
+        other = TieredCache(self.path, {})
+        other._cache.clear()
+        self.assertEqual(other.get('post_card:1'), 'карточка')
+
+    def test_counters_per_prefix(self):
+        """hits, misses and evictions are counted by key prefix"""
+        cache = self.make_cache(L1_MAX_ENTRIES=2)
+        cache.set('post_card:1', 1)
+        cache.get('post_card:1')
+        cache.get('shared_page:index')
+        cache.set('post_card:2', 2)
+        cache.set('sorl-thumbnail||image||x', 3)
+        cache.get('post_card:1')
+        stats = cache.stats()
+        self.assertEqual(stats['post_card'], {
+            'l1_hits': 1, 'l2_hits': 1, 'misses': 0, 'evictions': 2
+            })
+        self.assertEqual(stats['shared_page']['misses'], 1)
+        self.assertEqual(cache.stats(everywhere=True), stats)
+        self.assertEqual(cache.size(), (2, 3))
+
+    def test_stats_command(self):
+        """the command needs the tiered cache as the default one"""
+        output = StringIO()
+        call_command('cache_stats', stdout=output)
+        self.assertIn('L2 entries', output.getvalue())
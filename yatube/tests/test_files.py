@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+
+from yatube.files import IMMUTABLE, serve
+
+ROOT = tempfile.mkdtemp()
+
+
+class ServeTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.factory = RequestFactory()
+        with open(os.path.join(ROOT, 'style.css'), 'wb') as css:
+            css.write(b'0123456789')
+        with open(os.path.join(ROOT, 'style.0123456789ab.css'), 'wb') as css:
+            css.write(b'body {}')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def get(self, path='style.css', **headers):
+        return serve(self.factory.get('/' + path, **headers), path, ROOT)
+
+    def test_whole_file_and_conditional_requests(self):
+        """the file is streamed once, then answered with 304"""
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertNotEqual(response['Cache-Control'], IMMUTABLE)
+        response = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_ranges(self):
+        """single ranges get 206, unsatisfiable ones 416"""
+        response = self.get(HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        response = self.get(HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        response = self.get(HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_hashed_names_are_immutable(self):
+        """names with a content hash are cached for good"""
+        self.assertEqual(
+            self.get('style.0123456789ab.css')['Cache-Control'], IMMUTABLE
+            )
+
+    def test_offload(self):
+        """offload modes leave the bytes to the front server"""
+        with override_settings(FILE_SERVE_MODE='sendfile'):
+            response = self.get()
+            self.assertEqual(
+                response['X-Sendfile'], os.path.join(ROOT, 'style.css')
+                )
+            self.assertEqual(response.content, b'')
+        locations = {ROOT: '/protected/static/'}
+        with override_settings(
+                FILE_SERVE_MODE='accel', FILE_SERVE_ACCEL_LOCATIONS=locations):
+            response = self.get()
+            self.assertEqual(
+                response['X-Accel-Redirect'], '/protected/static/style.css'
+                )
+
+    def test_missing_and_outside_files(self):
+        """nothing outside the document root is served"""
+        for path in ('missing.css', '../etc/passwd', ''):
+            with self.subTest(path=path):
+                with self.assertRaises(Http404):
+                    self.get(path)
@@ -0,0 +1,86 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import views
+
+User = get_user_model()
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.guest_client = Client()
+        cls.staff_client = Client()
+        cls.staff_client.force_login(
+            User.objects.create_user(username='admin', is_staff=True)
+            )
+
+    def test_server_timing(self):
+        """every response says where its time went"""
+        cache.clear()
+        response = self.guest_client.get(reverse('index'))
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'queries', 'tpl;dur=', 'cache;desc=',
+                       'total;dur='):
+            with self.subTest(metric=metric):
+                self.assertIn(metric, timing)
+        self.assertNotIn('tpl;dur=0.0,', timing, 'Шаблоны не замерены')
+
+    def test_endpoint_is_restricted(self):
+        """only staff see the metrics, whatever the client address"""
+        response = self.guest_client.get(
+            reverse('metrics'), REMOTE_ADDR='127.0.0.1'
+            )
+        self.assertEqual(response.status_code, 404)
+        response = self.staff_client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_endpoint_with_token(self):
+        """a scraper gets the metrics with the configured token"""
+        for header, status in (('Bearer s3cret', 200),
+                               ('Bearer other', 404),
+                               ('s3cret', 404)):
+            with self.subTest(header=header):
+                response = self.guest_client.get(
+                    reverse('metrics'), HTTP_AUTHORIZATION=header
+                    )
+                self.assertEqual(response.status_code, status)
+
+    def test_histograms_per_url_name(self):
+        """requests are summed per URL name in Prometheus text format"""
+        self.guest_client.get(reverse('index'))
+        self.guest_client.get(reverse('index'))
+        text = self.staff_client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE yatube_request_duration_seconds histogram', text)
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{view="index",le="+Inf"}',
+            text
+            )
+        self.assertIn('yatube_requests_total{view="index",status="200"}', text)
+        self.assertIn('yatube_db_queries_total{view="index"}', text)
+        lines = text.splitlines()
+        buckets = [
+            line for line in lines
+            if line.startswith('yatube_request_duration_seconds_bucket'
+                               '{view="index"')
+            ]
+        counts = [float(line.rsplit(' ', 1)[1]) for line in buckets]
+        self.assertEqual(counts, sorted(counts), 'Корзины не накопительные')
+        self.assertTrue(buckets[-1].endswith('le="+Inf"}} {}'.format(
+            counts[-1])))
+
+    def test_query_budget_exceeded(self):
+        """a page running more queries than its budget is logged"""
+        cache.clear()
+        with mock.patch.object(views.index, 'query_budget', 0):
+            with self.assertLogs('yatube.metrics', 'WARNING') as logs:
+                self.guest_client.get(reverse('index'))
+        self.assertIn('its budget is 0', logs.output[0])
+        text = self.staff_client.get(reverse('metrics')).content.decode()
+        self.assertIn('yatube_query_budget_exceeded_total{view="index"}', text)
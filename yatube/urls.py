@@ -19,7 +19,9 @@ from django.contrib.flatpages import views
 from django.conf.urls import handler404, handler500, url
 from django.conf import settings
 from django.conf.urls.static import static
-from django.views.static import serve
+
+from yatube import metrics
+from yatube.files import serve
 
 handler404 = "posts.views.page_not_found"  # noqa
 handler500 = "posts.views.server_error"  # noqa 
@@ -41,6 +43,7 @@ urlpatterns = [
             {'url': '/about-spec/'},
             name='about-spec'
             ),
+        path('metrics', metrics.metrics, name='metrics'),
         path('auth/', include('users.urls')),
         path('auth/', include('django.contrib.auth.urls')),
         path('', include('posts.urls')),
@@ -54,6 +57,7 @@ if settings.DEBUG:
 
 
 if not settings.DEBUG:
+    # see yatube.files for FILE_SERVE_MODE and the caching headers
     urlpatterns += [
         url(r'^media/(?P<path>.*)$', serve,
             {'document_root': settings.MEDIA_ROOT}),